@@ -2,22 +2,125 @@ from dotenv import load_dotenv, find_dotenv
 load_dotenv(find_dotenv(), override=True)
 
 import asyncio
-import json
+import copy
+import functools
+import logging
+import os
 import time
 import chainlit as cl
+from chainlit.server import app as server_app
+from fastapi.responses import PlainTextResponse
+from llm import speculation
+from llm.context import estimate_tokens, is_summary
 from llm.llm_interface import send_to_llm, SYSTEM_PROMPT
-from llm.taskmaster import generate_mission, send_to_taskmaster
-from utils.tool_executor import execute_tool
+from llm.loop_guard import FALLBACK_REPLY, LoopGuard
+from llm.scheduler import BACKGROUND, INTERACTIVE, set_request_context
+from llm.mission_bank import ensure_refill, take_mission_options
+from llm.taskmaster import generate_mission, is_valid_mission_options, send_to_taskmaster
+from utils import session_store
+from utils.tool_executor import choose_mission_option, execute_tool, execute_tool_async, execute_tool_calls
+from utils.tracing import increment, register_collector, render_metrics, span, traced
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+logger = logging.getLogger(__name__)
 
 DEFAULT_GAME_STATE = {"current_mission": {}}
 
+# Process-wide tally used to report the average number of LLM calls per completed mission.
+MISSION_STATS = {"completed": 0, "llm_calls": 0}
+
+STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "1") == "1"
+
+# session id -> callback tasks currently running for it; cancelled when the session ends.
+_session_tasks = {}
+
+
+@server_app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(render_metrics())
+
+
+# Chainlit serves its UI from a catch-all route, so /metrics must be matched first.
+server_app.router.routes.insert(0, server_app.router.routes.pop())
+
+
+def _mission_metrics():
+    return [
+        f"secret_agents_missions_completed_total {MISSION_STATS['completed']}",
+        f"secret_agents_mission_llm_calls_total {MISSION_STATS['llm_calls']}",
+    ]
+
+
+register_collector(_mission_metrics)
+
+
+async def get_game_state():
+    state = await session_store.load(cl.context.session.id, "game_state")
+    return state if state is not None else copy.deepcopy(DEFAULT_GAME_STATE)
+
+
+async def set_game_state(state):
+    await session_store.save(cl.context.session.id, "game_state", state)
+
+
+async def get_messages():
+    messages = await session_store.load(cl.context.session.id, "messages")
+    return messages if messages is not None else []
+
+
+async def set_messages(messages):
+    await session_store.save(cl.context.session.id, "messages", messages)
+
+
+def cancellable(fn):
+    """Track a running callback so its LLM and tool work can be cancelled when the session ends."""
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        session_id = cl.context.session.id
+        task = asyncio.current_task()
+        _session_tasks.setdefault(session_id, set()).add(task)
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            tasks = _session_tasks.get(session_id)
+            if tasks is not None:
+                tasks.discard(task)
+                if not tasks:
+                    del _session_tasks[session_id]
+    return wrapper
+
+
+def cancel_session_tasks(session_id):
+    current = asyncio.current_task()
+    for task in _session_tasks.pop(session_id, ()):
+        if task is not current:
+            task.cancel()
+    speculation.cancel(session_id)
+
+
+async def trace_tags():
+    return {
+        "session_id": cl.context.session.id,
+        "phase": (await get_game_state()).get("current_mission", {}).get("phase", "none"),
+    }
 
-def get_game_state():
-    return cl.user_session.get("game_state", DEFAULT_GAME_STATE)
 
+async def count_llm_call():
+    session_id = cl.context.session.id
+    calls = await session_store.load(session_id, "llm_calls") or 0
+    await session_store.save(session_id, "llm_calls", calls + 1)
 
-def set_game_state(state):
-    cl.user_session.set("game_state", state)
+
+async def record_completed_mission():
+    session_id = cl.context.session.id
+    MISSION_STATS["completed"] += 1
+    MISSION_STATS["llm_calls"] += await session_store.load(session_id, "llm_calls") or 0
+    await session_store.save(session_id, "llm_calls", 0)
+    logger.info(
+        "Mission complete: %.2f LLM calls per completed mission over %d missions",
+        MISSION_STATS["llm_calls"] / MISSION_STATS["completed"],
+        MISSION_STATS["completed"],
+    )
 
 
 def parse_selected_shift(action_result):
@@ -63,35 +166,157 @@ def build_phase_actions(phase):
     return actions
 
 
-async def run_tool_loop(send_fn, messages, **send_kwargs):
-    """Run the tool-calling loop for any LLM sender and return (final_text, game_state)."""
-    result = await asyncio.to_thread(send_fn, messages, **send_kwargs)
+def start_reply():
+    """Return an empty Chainlit message and the token callback that streams into it (None when streaming is off)."""
+    msg = cl.Message(content="")
+    return msg, (msg.stream_token if STREAM_RESPONSES else None)
+
+
+async def finish_reply(msg, text, actions=None):
+    if not msg.content:
+        msg.content = text or ""
+    msg.actions = actions or []
+    await msg.send()
+
+
+async def call_agent(send_fn, messages, iteration, on_token, priority, send_kwargs):
+    if priority == INTERACTIVE:
+        await count_llm_call()
+    else:
+        # Speculative work is tallied apart so the per-mission figure reflects the player's own path.
+        increment("background_llm_calls", agent=send_fn.__name__)
+    set_request_context(session_id=cl.context.session.id, priority=priority)
+    with span("agent.llm_call", agent=send_fn.__name__, iteration=iteration):
+        return await send_fn(messages, on_token=on_token, **send_kwargs)
+
+
+async def run_tool_loop(send_fn, messages, on_token=None, priority=INTERACTIVE, **send_kwargs):
+    """Run the tool-calling loop for any LLM sender and return (final_text, game_state).
+
+    Text deltas are streamed to on_token across every iteration of the loop,
+    with a paragraph break between the text of consecutive iterations. Once the
+    agent's loop budget is spent the pending tool calls are dropped and one
+    last text-only completion is requested instead.
+    """
+    agent = send_fn.__name__
+    streamed = False
+
+    def iteration_stream():
+        if on_token is None:
+            return None
+        separate = streamed
+
+        async def on_delta(text):
+            nonlocal separate, streamed
+            if separate:
+                text = "\n\n" + text
+                separate = False
+            streamed = True
+            await on_token(text)
+
+        return on_delta
+
+    guard = LoopGuard(agent)
+    iteration = 1
+    result = await call_agent(send_fn, messages, iteration, iteration_stream(), priority, send_kwargs)
 
     while isinstance(result, dict):
-        assistant_msg = result["assistant_message"]
-        messages.append(assistant_msg)
-        for tc in assistant_msg.tool_calls:
-            tool_result, updated_state = execute_tool(
-                tc.function.name,
-                json.loads(tc.function.arguments),
+        reason = guard.exceeded(iteration, result["tool_calls"])
+        if reason is not None:
+            logger.warning("%s tool loop stopped after %d iterations: %s budget exhausted", agent, iteration, reason)
+            increment("tool_loop_aborted", agent=agent, reason=reason)
+            # The player may already have seen this turn's text; keep it in the history without its tool calls.
+            dropped_text = result["assistant_message"].get("content")
+            if dropped_text:
+                messages.append({"role": "assistant", "content": dropped_text})
+            iteration += 1
+            result = await call_agent(
+                send_fn, messages, iteration, iteration_stream(), priority, {**send_kwargs, "tool_choice": "none"}
+            )
+            if isinstance(result, dict):
+                result = result["assistant_message"].get("content") or FALLBACK_REPLY
+            break
+
+        messages.append(result["assistant_message"])
+        with span("agent.tool_calls", agent=agent, iteration=iteration, count=len(result["tool_calls"])):
+            tool_messages, updated_state = await execute_tool_calls(
+                result["tool_calls"],
                 send_kwargs.get("game_state"),
             )
-            if "game_state" in send_kwargs:
-                send_kwargs["game_state"] = updated_state
-            messages.append({
-                "role": "tool",
-                "tool_call_id": tc.id,
-                "content": tool_result,
-            })
-        result = await asyncio.to_thread(send_fn, messages, **send_kwargs)
+        if "game_state" in send_kwargs:
+            send_kwargs["game_state"] = updated_state
+        messages.extend(tool_messages)
+        iteration += 1
+        result = await call_agent(send_fn, messages, iteration, iteration_stream(), priority, send_kwargs)
 
     return result, send_kwargs.get("game_state")
 
 
+def choice_message(number, option):
+    return f"I choose mission option {number}: {option['location']}."
+
+
+async def speculate_briefing(number, game_state, messages):
+    """Run the briefing turn that picking option `number` would trigger, on private copies of the state."""
+    game_state = copy.deepcopy(game_state)
+    messages = copy.deepcopy(messages)
+    option, game_state = choose_mission_option(game_state, number)
+    messages.append({"role": "user", "content": choice_message(number, option)})
+    result, game_state = await run_tool_loop(
+        send_to_taskmaster, messages, priority=BACKGROUND, game_state=game_state
+    )
+    return result, messages, game_state
+
+
+def start_speculation(game_state, messages):
+    """Pre-generate the briefing (and warm the weather) for each offered option while the player decides."""
+    if not speculation.SPECULATIVE_BRIEFINGS:
+        return
+    session_id = cl.context.session.id
+    cost = sum(estimate_tokens(m) for m in messages) + speculation.SPECULATION_COMPLETION_TOKENS
+    tasks = {}
+    weather = {}
+    for number, option in enumerate(game_state.get("mission_options", []), start=1):
+        if not speculation.charge(session_id, cost):
+            break
+        tasks[number] = asyncio.create_task(speculate_briefing(number, game_state, messages))
+        weather[number] = speculation.warm_weather(option["location"])
+    if tasks:
+        speculation.start(session_id, copy.deepcopy(messages), tasks, weather)
+
+
+async def commit_speculative_briefing(number):
+    """Send the pre-generated briefing for option `number` as this turn's reply; False if there is none."""
+    task = speculation.take(cl.context.session.id, number, await get_messages())
+    if task is None:
+        return False
+    if not task.done():
+        # Still queued or running at background priority; waiting for it could be slower than
+        # a fresh interactive request, so drop it and generate the briefing live.
+        task.cancel()
+        increment("speculative_briefings", outcome="unfinished")
+        return False
+    try:
+        result, messages, game_state = task.result()
+    except Exception:
+        logger.warning("Speculative briefing for option %d failed; generating it live", number, exc_info=True)
+        return False
+
+    increment("speculative_briefings", outcome="used")
+    await set_game_state(game_state)
+    await set_messages(messages)
+    phase = game_state.get("current_mission", {}).get("phase", "none")
+    msg, _ = start_reply()
+    await finish_reply(msg, result, build_phase_actions(phase))
+    return True
+
+
 @cl.on_chat_start
+@traced("callback.on_chat_start", trace_tags)
 async def on_chat_start():
-    cl.user_session.set("messages", [])
-    set_game_state(DEFAULT_GAME_STATE)
+    await set_messages([])
+    await set_game_state(copy.deepcopy(DEFAULT_GAME_STATE))
+    await ensure_refill()
     actions = [cl.Action(name="new_game", value="new_game", label="New Game", payload={})]
     await cl.Message(
         content="Welcome, Agent. Your mission awaits. Click **New Game** to receive your briefing.",
@@ -100,10 +325,38 @@ async def on_chat_start():
 
 
 @cl.action_callback("new_game")
+@traced("callback.on_new_game", trace_tags)
+@cancellable
 async def on_new_game(action: cl.Action):
-    mission_options = await asyncio.to_thread(generate_mission)
+    # Briefings speculated for the previous game's menu are no longer wanted.
+    speculation.cancel(cl.context.session.id)
+    await session_store.save(cl.context.session.id, "llm_calls", 0)
+    mission_options = await take_mission_options()
+    if mission_options is None:
+        # Bank is empty: generate live, listing each destination as soon as it has been validated.
+        await count_llm_call()
+        set_request_context(session_id=cl.context.session.id, priority=INTERACTIVE)
+        scanning = cl.Message(content="🛰️ **Scanning for missions...**\n")
+        await scanning.send()
+
+        async def on_option(option):
+            await scanning.stream_token(f"\n- {option['location']}")
+
+        try:
+            mission_options = (await generate_mission(on_option=on_option)).get("options", [])
+        except Exception:
+            # Retries exhausted or a non-retryable API error; fall through to the Signal lost reply.
+            logger.exception("Live mission generation failed")
+            mission_options = []
+        await scanning.update()
+        if not is_valid_mission_options(mission_options):
+            await cl.Message(
+                content="📡 **Signal lost.** HQ could not assemble a full set of missions. Try again, Agent.",
+                actions=[cl.Action(name="new_game", value="new_game", label="New Game", payload={})],
+            ).send()
+            return
     game_state = {
-        "mission_options": mission_options.get("options", []),
+        "mission_options": mission_options,
         "current_mission": {
             "active": True,
             "phase": "travel",
@@ -113,31 +366,41 @@ async def on_new_game(action: cl.Action):
             "completed_phases": [],
         }
     }
-    set_game_state(game_state)
+    await set_game_state(game_state)
 
     briefing_messages = [
         {"role": "user", "content": "Start the mission. Present the available mission options."}
     ]
-    cl.user_session.set("messages", briefing_messages)
-    briefing, game_state = await run_tool_loop(send_to_taskmaster, briefing_messages, game_state=game_state)
-    set_game_state(game_state)
+    await set_messages(briefing_messages)
+    msg, on_token = start_reply()
+    briefing, game_state = await run_tool_loop(
+        send_to_taskmaster, briefing_messages, on_token=on_token, game_state=game_state
+    )
+    await set_game_state(game_state)
+    await set_messages(briefing_messages)
 
     phase = game_state.get("current_mission", {}).get("phase", "unknown")
 
-    await cl.Message(content=briefing, actions=build_phase_actions(phase)).send()
+    await finish_reply(msg, briefing, build_phase_actions(phase))
+    if phase == "travel":
+        start_speculation(game_state, briefing_messages)
 
 
 @cl.action_callback("get_weather")
+@traced("callback.on_get_weather", trace_tags)
+@cancellable
 async def on_get_weather(action: cl.Action):
-    game_state = get_game_state()
+    game_state = await get_game_state()
     location = game_state.get("current_mission", {}).get("location", "London")
 
-    weather_report, _ = execute_tool("weather", {"city": location}, game_state)
+    weather_report, _ = await execute_tool_async("weather", {"city": location}, game_state)
 
     await cl.Message(content=f"📡 **Weather Intelligence for {location}:**\n{weather_report}").send()
 
 
 @cl.action_callback("use_decryptor")
+@traced("callback.on_use_decryptor", trace_tags)
+@cancellable
 async def on_use_decryptor(action: cl.Action):
     res = await cl.AskActionMessage(
         content="🔐 **Decryptor Armed.**\n\nBefore you proceed — re-read your briefing carefully. The Taskmaster never wastes words. Something in that message holds the key.\n\nSelect the shift:",
@@ -158,55 +421,69 @@ async def on_use_decryptor(action: cl.Action):
         ).send()
         return
 
-    game_state = get_game_state()
+    game_state = await get_game_state()
     mission = game_state.get("current_mission", {})
     cipher = mission.get("cipher")
     actual_shift = mission.get("shift")
 
     if user_shift == actual_shift:
-        decrypted, _ = execute_tool("decrypt_message", {"ciphertext": cipher, "shift": user_shift}, game_state)
+        decrypted, _ = await execute_tool_async(
+            "decrypt_message", {"ciphertext": cipher, "shift": user_shift}, game_state
+        )
         await cl.Message(content=f"✅ **DECRYPTION SUCCESSFUL:**\n\n> {decrypted}").send()
 
         _, game_state = execute_tool("update_game_phase", {"phase": "complete"}, game_state)
-        set_game_state(game_state)
+        await set_game_state(game_state)
 
-        messages = cl.user_session.get("messages", [])
+        messages = await get_messages()
         messages.append({"role": "user", "content": f"The message has been decrypted: {decrypted}. Mission complete."})
-        debrief, game_state = await run_tool_loop(send_to_taskmaster, messages, game_state=game_state)
-        set_game_state(game_state)
-        cl.user_session.set("messages", messages)
+        msg, on_token = start_reply()
+        debrief, game_state = await run_tool_loop(
+            send_to_taskmaster, messages, on_token=on_token, game_state=game_state
+        )
+        await set_game_state(game_state)
+        await set_messages(messages)
 
-        await cl.Message(content=debrief).send()
+        await finish_reply(msg, debrief)
+        await record_completed_mission()
     else:
         _, game_state = execute_tool("update_game_phase", {"phase": "complete"}, game_state)
-        set_game_state(game_state)
+        await set_game_state(game_state)
+        await record_completed_mission()
         await cl.Message(
             content="💀 **GAME OVER:** Mission failed. Incorrect decryptor key compromised the operation.",
         ).send()
 
 
 async def process_user_input(user_content: str):
-    game_state = get_game_state()
+    game_state = await get_game_state()
     mission = game_state.get("current_mission", {})
-    messages = cl.user_session.get("messages", [])
+    messages = await get_messages()
     messages.append({"role": "user", "content": user_content})
 
+    msg, on_token = start_reply()
     if mission.get("active"):
-        result, game_state = await run_tool_loop(send_to_taskmaster, messages, game_state=game_state)
-        set_game_state(game_state)
+        result, game_state = await run_tool_loop(
+            send_to_taskmaster, messages, on_token=on_token, game_state=game_state
+        )
+        await set_game_state(game_state)
+        if game_state.get("current_mission", {}).get("phase") == "complete":
+            await record_completed_mission()
     else:
-        if not any(m.get("role") == "system" for m in messages):
+        if not any(m.get("role") == "system" and not is_summary(m) for m in messages):
             messages.insert(0, {"role": "system", "content": SYSTEM_PROMPT})
-        result, _ = await run_tool_loop(send_to_llm, messages)
+        result, _ = await run_tool_loop(send_to_llm, messages, on_token=on_token)
 
-    cl.user_session.set("messages", messages)
+    await set_messages(messages)
 
     phase = game_state.get("current_mission", {}).get("phase", "none") if game_state.get("current_mission", {}).get("active") else "inactive"
 
-    await cl.Message(content=result, actions=build_phase_actions(phase)).send()
+    await finish_reply(msg, result, build_phase_actions(phase))
 
 
 @cl.action_callback("choose_option")
+@traced("callback.on_choose_option", trace_tags)
+@cancellable
 async def on_choose_option(action: cl.Action):
     if isinstance(action, dict):
         selection = (
@@ -223,16 +500,25 @@ async def on_choose_option(action: cl.Action):
             or getattr(action, "name", "").rsplit("_", 1)[-1]
         )
     normalized = str(selection).strip()
-    game_state = get_game_state()
+    game_state = await get_game_state()
     phase = game_state.get("current_mission", {}).get("phase")
 
     if normalized in {"1", "2", "3"} and phase == "travel":
-        await process_user_input(f"I choose mission option {normalized}.")
+        # The pick is unambiguous, so apply select_mission + briefing locally and
+        # let the Taskmaster spend its single call on the briefing narrative.
+        option, game_state = choose_mission_option(game_state, int(normalized))
+        if option is None:
+            await process_user_input(f"I choose mission option {normalized}.")
+            return
+        await set_game_state(game_state)
+        if await commit_speculative_briefing(int(normalized)):
+            return
+        await process_user_input(choice_message(int(normalized), option))
         return
 
     if normalized in {"1", "2", "3"} and phase == "briefing":
         _, game_state = execute_tool("update_game_phase", {"phase": "crack_code"}, game_state)
-        set_game_state(game_state)
+        await set_game_state(game_state)
         await process_user_input(f"I choose disguise option {normalized}. Proceed to crack code.")
         return
 
@@ -240,5 +526,22 @@ async def on_choose_option(action: cl.Action):
 
 
 @cl.on_message
+@traced("callback.handle_message", trace_tags)
+@cancellable
 async def handle_message(message: cl.Message):
+    # Free text changes the conversation the speculative briefings were built on.
+    speculation.cancel(cl.context.session.id)
     await process_user_input(message.content)
+
+
+@cl.on_stop
+async def on_stop():
+    cancel_session_tasks(cl.context.session.id)
+
+
+@cl.on_chat_end
+async def on_chat_end():
+    # The player is gone: stop their in-flight LLM and tool work to free scheduler slots and threads.
+    cancel_session_tasks(cl.context.session.id)
+    speculation.forget(cl.context.session.id)
+    await session_store.delete(cl.context.session.id)
@@ -0,0 +1,52 @@
+"""Microbenchmark of the table-driven Caesar engine against the original per-character loop.
+
+Run from src/:  python -m benchmarks.cipher_bench
+"""
+import random
+import string
+import timeit
+from gadgets.decryptor import all_shifts, caesar_shift_bytes, encrypt_message, encrypt_messages
+
+
+def legacy_caesar_shift(text, shift):
+    result = []
+    for char in text.upper():
+        if char.isalpha():
+            result.append(chr(((ord(char) - 65 + shift) % 26) + 65))
+        else:
+            result.append(char)
+    return ''.join(result)
+
+
+def _report(label, legacy_fn, new_fn, number):
+    legacy = min(timeit.repeat(legacy_fn, number=number, repeat=5))
+    new = min(timeit.repeat(new_fn, number=number, repeat=5))
+    print(f"{label:<32} legacy {legacy * 1e6 / number:9.2f} us   new {new * 1e6 / number:9.2f} us   x{legacy / new:6.1f}")
+
+
+def main():
+    rng = random.Random(0)
+    alphabet = string.ascii_uppercase + " "
+    phrases = ["".join(rng.choice(alphabet) for _ in range(24)) for _ in range(1000)]
+    shifts = [rng.randint(1, 5) for _ in phrases]
+    phrase = phrases[0]
+    corpus = "".join(phrases) * 100
+
+    assert encrypt_messages(phrases, shifts) == [legacy_caesar_shift(p, s) for p, s in zip(phrases, shifts)]
+
+    _report("single mission phrase", lambda: legacy_caesar_shift(phrase, 3), lambda: encrypt_message(phrase, 3), 20000)
+    _report("batch of 1000 phrases", lambda: [legacy_caesar_shift(p, s) for p, s in zip(phrases, shifts)],
+            lambda: encrypt_messages(phrases, shifts), 20)
+    _report("brute force, 26 shifts", lambda: [legacy_caesar_shift(phrase, -s) for s in range(26)],
+            lambda: all_shifts(phrase), 2000)
+    _report("2.4 MB corpus (str)", lambda: legacy_caesar_shift(corpus, 3), lambda: encrypt_message(corpus, 3), 1)
+
+    try:
+        data = corpus.encode("ascii")
+        _report("2.4 MB corpus (numpy bytes)", lambda: legacy_caesar_shift(corpus, 3), lambda: caesar_shift_bytes(data, 3), 1)
+    except ImportError:
+        print("numpy not installed; skipping the byte-array path")
+
+
+if __name__ == "__main__":
+    main()
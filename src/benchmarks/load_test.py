@@ -0,0 +1,113 @@
+"""Offline load test: N simulated players run full missions against local LLM and weather stubs.
+
+Run from src/:  python -m benchmarks.load_test --players 50
+
+Each player goes through on_chat_start -> new_game -> choose_option ->
+get_weather -> choose_option (disguise) -> use_decryptor, calling the real
+Chainlit handlers in app.py inside its own Chainlit context. Reports p50/p95/p99
+turn latency, LLM calls per mission and throughput.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+from benchmarks.stubs import STUB_STATS, start_stubs
+
+
+def _percentile(values, pct):
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
+
+
+async def run_player(app, cl, player_id, turn_latencies, errors):
+    from chainlit.context import context_var, init_http_context
+    from chainlit.emitter import BaseChainlitEmitter
+
+    class BenchEmitter(BaseChainlitEmitter):
+        async def send_ask_user(self, step_dict, spec, raise_on_timeout=False):
+            # Answer the decryptor prompt with the correct shift, like a player who read the briefing.
+            shift = str((await app.get_game_state()).get("current_mission", {}).get("shift", 1))
+            return {"name": f"shift_{shift}", "value": shift, "label": shift, "payload": {}}
+
+    init_http_context()
+    context = context_var.get()
+    context.emitter = BenchEmitter(context.session)
+
+    turns = [
+        ("chat_start", app.on_chat_start, ()),
+        ("new_game", app.on_new_game, (cl.Action(name="new_game", value="new_game", label="New Game", payload={}),)),
+        ("choose_mission", app.on_choose_option, (cl.Action(name="choose_option", value="1", label="1", payload={}),)),
+        ("get_weather", app.on_get_weather, (cl.Action(name="get_weather", value="get_weather", label="Weather", payload={}),)),
+        ("choose_disguise", app.on_choose_option, (cl.Action(name="choose_option", value="2", label="2", payload={}),)),
+        ("use_decryptor", app.on_use_decryptor, (cl.Action(name="use_decryptor", value="use_decryptor", label="Decrypt", payload={}),)),
+    ]
+    for name, handler, args in turns:
+        start = time.perf_counter()
+        try:
+            await handler(*args)
+        except Exception as e:
+            errors.append(f"player {player_id} {name}: {e!r}")
+            return
+        turn_latencies.setdefault(name, []).append(time.perf_counter() - start)
+
+
+async def main_async(args):
+    llm_url, weather_url, _ = start_stubs(args.llm_latency, args.token_latency, args.weather_latency)
+    # Configure the app before it is imported so its clients pick up the stub endpoints.
+    os.environ.update({
+        "OPENAI_BASE_URL": llm_url,
+        "OPENAI_API_KEY": "stub",
+        "OPENWEATHER_URL": weather_url,
+        "OPENWEATHER_API_KEY": "stub",
+        "STREAM_RESPONSES": "1" if args.stream else "0",
+    })
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    import chainlit as cl
+    import app
+
+    turn_latencies = {}
+    errors = []
+    semaphore = asyncio.Semaphore(args.concurrency or args.players)
+
+    async def bounded(player_id):
+        async with semaphore:
+            await run_player(app, cl, player_id, turn_latencies, errors)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(asyncio.create_task(bounded(i)) for i in range(args.players)))
+    elapsed = time.perf_counter() - start
+
+    all_turns = [latency for latencies in turn_latencies.values() for latency in latencies]
+    completed = app.MISSION_STATS["completed"]
+    print(f"players: {args.players}  completed missions: {completed}  errors: {len(errors)}  wall time: {elapsed:.2f}s")
+    print(f"{'turn':<16}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, latencies in list(turn_latencies.items()) + [("all", all_turns)]:
+        print(
+            f"{name:<16}{len(latencies):>6}"
+            f"{_percentile(latencies, 50) * 1000:>10.1f}"
+            f"{_percentile(latencies, 95) * 1000:>10.1f}"
+            f"{_percentile(latencies, 99) * 1000:>10.1f}"
+        )
+    if completed:
+        print(f"LLM calls per mission: {app.MISSION_STATS['llm_calls'] / completed:.2f}")
+    print(f"throughput: {completed / elapsed:.2f} missions/s, {len(all_turns) / elapsed:.2f} turns/s")
+    print(f"stub traffic: {STUB_STATS['chat_requests']} chat requests, {STUB_STATS['weather_requests']} weather requests")
+    for error in errors[:10]:
+        print(error)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--players", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=0, help="max players in flight (default: all)")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds before the stub LLM answers")
+    parser.add_argument("--token-latency", type=float, default=0.005, help="seconds between streamed words")
+    parser.add_argument("--weather-latency", type=float, default=0.05)
+    parser.add_argument("--no-stream", dest="stream", action="store_false", help="request whole completions")
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
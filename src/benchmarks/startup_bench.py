@@ -0,0 +1,122 @@
+"""Cold-start benchmark: import-time profile of app.py and time to the first on_chat_start response.
+
+Run from src/:  python -m benchmarks.startup_bench --runs 5
+
+Each run is a fresh interpreter (as after the Space scales up from zero) that
+imports app.py and drives on_chat_start against the local stubs until its
+welcome message is sent and the event loop has run the work it scheduled. One extra run under `python -X importtime` reports the
+modules that dominate import time.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from benchmarks.stubs import start_stubs
+
+# Event-loop steps given to the tasks on_chat_start schedules before the clock stops.
+LOOP_STEPS = 10
+
+_IMPORTTIME_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+async def _first_response():
+    """Child process: import the app, then time on_chat_start up to its first sent message.
+
+    The clock only stops once the event loop has also run a few steps of the
+    work on_chat_start scheduled (the mission-bank refill), so anything that
+    blocks the loop there delays the response the next player would see.
+    """
+    started = time.perf_counter()
+    from chainlit.context import context_var, init_http_context
+    from chainlit.emitter import BaseChainlitEmitter
+
+    import app
+
+    imported = time.perf_counter()
+    first_message = []
+
+    class FirstMessageEmitter(BaseChainlitEmitter):
+        async def send_step(self, step_dict):
+            if not first_message:
+                first_message.append(time.perf_counter())
+
+    init_http_context()
+    context = context_var.get()
+    context.emitter = FirstMessageEmitter(context.session)
+    await app.on_chat_start()
+    for _ in range(LOOP_STEPS):
+        await asyncio.sleep(0)
+    settled = time.perf_counter()
+    return {
+        "import_s": imported - started,
+        "welcome_sent_s": (first_message[0] if first_message else settled) - started,
+        "first_response_s": settled - started,
+    }
+
+
+def _child_env(llm_url, weather_url):
+    return {
+        **os.environ,
+        "OPENAI_BASE_URL": llm_url,
+        "OPENAI_API_KEY": "stub",
+        "OPENWEATHER_URL": weather_url,
+        "OPENWEATHER_API_KEY": "stub",
+        "LOG_LEVEL": "WARNING",
+    }
+
+
+def import_profile(env, top):
+    """Return the `top` slowest top-level imports as (cumulative_us, self_us, module)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_RE.match(line)
+        # Direct imports of app.py are indented by one level.
+        if match and len(match.group(3)) <= 3:
+            rows.append((int(match.group(2)), int(match.group(1)), match.group(4)))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="modules listed in the import profile")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(asyncio.run(_first_response())))
+        return
+
+    llm_url, weather_url, _ = start_stubs(llm_latency=0.0, token_latency=0.0, weather_latency=0.0)
+    env = _child_env(llm_url, weather_url)
+
+    print(f"{'cumulative ms':>14}{'self ms':>10}  module")
+    for cumulative, own, module in import_profile(env, args.top):
+        print(f"{cumulative / 1000:>14.1f}{own / 1000:>10.1f}  {module}")
+
+    runs = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-m", "benchmarks.startup_bench", "--child"],
+            env=env, capture_output=True, text=True, check=True,
+        )
+        runs.append({**json.loads(result.stdout.splitlines()[-1]), "process_s": time.perf_counter() - started})
+
+    print(f"\n{'metric':<20}{'median ms':>12}{'max ms':>10}")
+    for metric in ("import_s", "welcome_sent_s", "first_response_s", "process_s"):
+        values = [run[metric] for run in runs]
+        print(f"{metric:<20}{statistics.median(values) * 1000:>12.1f}{max(values) * 1000:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
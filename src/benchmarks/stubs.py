@@ -0,0 +1,228 @@
+"""Local stand-ins for the OpenAI chat completions API and the OpenWeather endpoint.
+
+The fake LLM answers with scripted text and tool calls chosen from the request
+(mission generation, Taskmaster phase, Quartermaster chat), so the whole game
+loop can be driven offline with configurable latency.
+"""
+import json
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CITIES = ["Lisbon", "Istanbul", "Prague", "Havana", "Reykjavik", "Marrakesh"]
+
+STUB_STATS = {"chat_requests": 0, "weather_requests": 0}
+_stats_lock = threading.Lock()
+
+
+def _count(key):
+    with _stats_lock:
+        STUB_STATS[key] += 1
+
+
+def _mission_options(seed):
+    return {
+        "options": [
+            {
+                "location": CITIES[(seed + i) % len(CITIES)],
+                "description": "Rain hammers the rooftops. A courier is late and nobody trusts the ferry schedule.",
+                "plaintext": "MEET AT THE DOCKS",
+                "shift": (seed + i) % 5 + 1,
+                "shift_hint": "count the bells at midnight",
+            }
+            for i in range(3)
+        ]
+    }
+
+
+def _script(body):
+    """Pick (text, tool_calls) for a chat request."""
+    messages = body.get("messages", [])
+    tools = {tool["function"]["name"] for tool in body.get("tools", [])}
+    system = "\n".join(m.get("content") or "" for m in messages if m.get("role") == "system")
+    last = next((m for m in reversed(messages) if m.get("role") != "system"), {})
+
+    if "spy mission generator" in system:
+        return json.dumps(_mission_options(STUB_STATS["chat_requests"])), []
+
+    if "running summary" in system:
+        return "The agent picked a destination and is working through the mission.", []
+
+    if "select_mission" not in tools:
+        return "The Quartermaster adjusts his cufflinks. Gadgets are in the usual drawer, Agent.", []
+
+    phase_match = re.search(r"Phase: (\w+)", system)
+    phase = phase_match.group(1) if phase_match else "travel"
+    location_match = re.search(r"Location: (.+)", system)
+    location = location_match.group(1).strip() if location_match else "London"
+
+    if last.get("role") == "tool":
+        return f"Intel received. Stay sharp in {location}.", []
+    choice = re.search(r"I choose mission option (\d)", last.get("content") or "")
+    if phase == "travel" and choice:
+        options = re.findall(r"- (.+?) \(Cipher: (.+?), Shift: (\d)\)", system)
+        chosen_location, cipher, shift = options[int(choice.group(1)) - 1]
+        return "", [
+            ("select_mission", {"location": chosen_location, "cipher": cipher, "shift": int(shift)}),
+            ("update_game_phase", {"phase": "briefing"}),
+        ]
+    if phase == "briefing" and "disguise" not in (last.get("content") or ""):
+        return "", [("weather", {"city": location})]
+    if phase == "travel":
+        return "Three doors, Agent. 1) Lisbon 2) Istanbul 3) Prague. Choose.", []
+    if phase == "briefing":
+        return f"{location} at dusk. Two ravens on the wire. Disguises: 1) Porter 2) Priest 3) Tourist.", []
+    if phase == "crack_code":
+        return "The cipher is in your hands. Use the Decryptor Gadget.", []
+    return "Debrief complete. Rating: exemplary. Burn this channel.", []
+
+
+def _tool_call_payload(tool_calls):
+    return [
+        {
+            "index": i,
+            "id": f"call_{uuid.uuid4().hex[:12]}",
+            "type": "function",
+            "function": {"name": name, "arguments": json.dumps(arguments)},
+        }
+        for i, (name, arguments) in enumerate(tool_calls)
+    ]
+
+
+def _usage(body, text):
+    prompt_tokens = sum(len(m.get("content") or "") for m in body.get("messages", [])) // 4
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": len(text) // 4 + 1,
+        "total_tokens": prompt_tokens + len(text) // 4 + 1,
+        "prompt_tokens_details": {"cached_tokens": 0},
+    }
+
+
+def make_llm_handler(latency, token_latency):
+    class FakeLLMHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            if not self.path.endswith("/chat/completions"):
+                self.send_error(404)
+                return
+            _count("chat_requests")
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            text, tool_calls = _script(body)
+            if body.get("tool_choice") == "none" and tool_calls:
+                text, tool_calls = "Understood, Agent. Stand by for orders.", []
+            time.sleep(latency)
+            if body.get("stream"):
+                self._stream(body, text, tool_calls)
+            else:
+                self._complete(body, text, tool_calls)
+
+        def _complete(self, body, text, tool_calls):
+            calls = _tool_call_payload(tool_calls)
+            for call in calls:
+                call.pop("index")
+            payload = {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+                "choices": [{
+                    "index": 0,
+                    "finish_reason": "tool_calls" if calls else "stop",
+                    "message": {"role": "assistant", "content": text or None, "tool_calls": calls or None},
+                }],
+                "usage": _usage(body, text),
+            }
+            data = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _stream(self, body, text, tool_calls):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            base = {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "stub"),
+            }
+
+            def emit(payload):
+                line = f"data: {payload}\n\n".encode()
+                self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                self.wfile.flush()
+
+            for word in re.findall(r"\S+\s*", text):
+                time.sleep(token_latency)
+                emit(json.dumps({**base, "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}]}))
+            if tool_calls:
+                emit(json.dumps({**base, "choices": [{"index": 0, "delta": {"tool_calls": _tool_call_payload(tool_calls)}, "finish_reason": None}]}))
+            finish = "tool_calls" if tool_calls else "stop"
+            emit(json.dumps({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": finish}]}))
+            emit(json.dumps({**base, "choices": [], "usage": _usage(body, text)}))
+            emit("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+
+    return FakeLLMHandler
+
+
+def make_weather_handler(latency):
+    class FakeWeatherHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            _count("weather_requests")
+            city = parse_qs(urlparse(self.path).query).get("q", ["London"])[0]
+            time.sleep(latency)
+            data = json.dumps({
+                "cod": 200,
+                "name": city,
+                "weather": [{"description": "light rain"}],
+                "main": {"temp": 14.2},
+                "timezone": 0,
+                "dt": int(time.time()),
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    return FakeWeatherHandler
+
+
+def start_server(handler):
+    """Serve `handler` on a free localhost port in a daemon thread and return the server."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def start_stubs(llm_latency=0.2, token_latency=0.005, weather_latency=0.05):
+    """Start both stubs and return (llm_base_url, weather_url, servers)."""
+    llm = start_server(make_llm_handler(llm_latency, token_latency))
+    weather = start_server(make_weather_handler(weather_latency))
+    llm_url = f"http://127.0.0.1:{llm.server_address[1]}/v1"
+    weather_url = f"http://127.0.0.1:{weather.server_address[1]}/data/2.5/weather"
+    return llm_url, weather_url, (llm, weather)
+
+
+if __name__ == "__main__":
+    llm_url, weather_url, _ = start_stubs()
+    print(f"OPENAI_BASE_URL={llm_url}")
+    print(f"OPENWEATHER_URL={weather_url}")
+    threading.Event().wait()
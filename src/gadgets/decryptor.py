@@ -1,6 +1,17 @@
-def _caesar_shift(text, shift):
+import string
+
+_UPPER = string.ascii_uppercase
+
+# One str.translate table per shift 0-25, built once at import.
+_SHIFT_TABLES = [
+    str.maketrans(_UPPER, _UPPER[shift:] + _UPPER[:shift])
+    for shift in range(26)
+]
+
+
+def _caesar_shift_slow(text, shift):
     result = []
-    for char in text.upper():
+    for char in text:
         if char.isalpha():
             result.append(chr(((ord(char) - 65 + shift) % 26) + 65))
         else:
@@ -8,6 +19,23 @@ def _caesar_shift(text, shift):
     return ''.join(result)
 
 
+def _caesar_shift(text, shift):
+    text = text.upper()
+    if not text.isascii():
+        # Non-ASCII letters keep the original arithmetic so output is unchanged.
+        return _caesar_shift_slow(text, shift)
+    return text.translate(_SHIFT_TABLES[shift % 26])
+
+
+def _shifts_for(texts, shift):
+    if isinstance(shift, int):
+        return [shift] * len(texts)
+    shifts = list(shift)
+    if len(shifts) != len(texts):
+        raise ValueError("Expected one shift per message.")
+    return shifts
+
+
 def encrypt_message(plaintext, shift):
     return _caesar_shift(plaintext, shift)
 
@@ -15,3 +43,34 @@ def encrypt_message(plaintext, shift):
 def decrypt_message(ciphertext, shift):
     decrypted = _caesar_shift(ciphertext, -shift)
     return f"Unencrypted message: {decrypted}"
+
+
+def encrypt_messages(plaintexts, shift):
+    """Encrypt many messages in one call; `shift` is one int for all or one per message."""
+    plaintexts = list(plaintexts)
+    return [_caesar_shift(text, s) for text, s in zip(plaintexts, _shifts_for(plaintexts, shift))]
+
+
+def decrypt_messages(ciphertexts, shift):
+    """Decrypt many messages in one call, returning bare plaintexts without the gadget prefix."""
+    ciphertexts = list(ciphertexts)
+    return [_caesar_shift(text, -s) for text, s in zip(ciphertexts, _shifts_for(ciphertexts, shift))]
+
+
+def all_shifts(ciphertext):
+    """Brute-force a ciphertext: element i is the plaintext for shift i (0-25)."""
+    return [_caesar_shift(ciphertext, -shift) for shift in range(26)]
+
+
+def caesar_shift_bytes(data, shift):
+    """Upper-case and shift an ASCII byte buffer with NumPy; meant for very large corpora.
+
+    NumPy is an optional dependency and is imported on first use.
+    """
+    import numpy as np
+
+    array = np.frombuffer(bytes(data), dtype=np.uint8).copy()
+    array[(array >= 97) & (array <= 122)] -= 32
+    letters = (array >= 65) & (array <= 90)
+    array[letters] = (array[letters] - 65 + shift % 26) % 26 + 65
+    return array.tobytes()
@@ -1,17 +1,55 @@
 import os
-import requests
+import threading
+from concurrent.futures import Future
 from datetime import datetime, timezone, timedelta
-from dotenv import load_dotenv
+from utils import cassette
+from utils.tracing import span
+from utils.ttl_cache import TTLCache
 
-load_dotenv()
+# Point this at a local stub server to run without the real OpenWeather API.
+OPENWEATHER_URL = os.getenv("OPENWEATHER_URL", "http://api.openweathermap.org/data/2.5/weather")
+WEATHER_TIMEOUT = float(os.getenv("WEATHER_TIMEOUT", "3"))
+WEATHER_CACHE_TTL = float(os.getenv("WEATHER_CACHE_TTL", "600"))
+WEATHER_CACHE_SIZE = int(os.getenv("WEATHER_CACHE_SIZE", "256"))
+WEATHER_STALE_WHILE_REVALIDATE = os.getenv("WEATHER_STALE_WHILE_REVALIDATE", "1") == "1"
 
+_session = None
+_session_lock = threading.Lock()
 
-def get_weather(location):
+_cache = TTLCache(WEATHER_CACHE_SIZE, WEATHER_CACHE_TTL)
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def _get_session():
+    """Return the pooled requests session, importing requests on the first weather lookup."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+    return _session
+
+
+def _fetch_weather(location):
+    """Return (report, cacheable), from the upstream endpoint or the active cassette."""
+    report, cacheable = cassette.call("weather", {"city": location}, lambda: _fetch_live(location))
+    return report, cacheable
+
+
+def _fetch_live(location):
     API_KEY = os.getenv("OPENWEATHER_API_KEY")
-    url = f"http://api.openweathermap.org/data/2.5/weather?q={location}&appid={API_KEY}&units=metric"
+    params = {"q": location, "appid": API_KEY, "units": "metric"}
 
     try:
-        response = requests.get(url)
+        with span("weather.http", city=location):
+            response = _get_session().get(OPENWEATHER_URL, params=params, timeout=WEATHER_TIMEOUT)
         data = response.json()
         if data["cod"] == 200:
             weather = data["weather"][0]["description"]
@@ -19,8 +57,54 @@ def get_weather(location):
             tz_offset = data["timezone"]
             local_time = datetime.fromtimestamp(data["dt"], tz=timezone(timedelta(seconds=tz_offset)))
             formatted_time = local_time.strftime("%A, %B %d, %Y %I:%M %p")
-            return f"Weather in {location}: {weather}, {temperature}°C — {formatted_time} (local time)"
+            return f"Weather in {location}: {weather}, {temperature}°C — {formatted_time} (local time)", True
         else:
-            return f"Could not retrieve weather for {location}."
+            return f"Could not retrieve weather for {location}.", False
     except Exception as e:
-        return "Error retrieving weather data."
+        return "Error retrieving weather data.", False
+
+
+def _coalesced_fetch(key, location):
+    """Fetch a city, sharing one upstream call between every thread asking for it at the same time."""
+    with _in_flight_lock:
+        future = _in_flight.get(key)
+        is_owner = future is None
+        if is_owner:
+            future = _in_flight[key] = Future()
+
+    if not is_owner:
+        return future.result()
+
+    try:
+        report, cacheable = _fetch_weather(location)
+        if cacheable:
+            _cache.set(key, report)
+        future.set_result(report)
+        return report
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _in_flight_lock:
+            _in_flight.pop(key, None)
+
+
+def _revalidate(key, location):
+    with _in_flight_lock:
+        if key in _in_flight:
+            return
+    threading.Thread(target=_coalesced_fetch, args=(key, location), daemon=True).start()
+
+
+def get_weather(location):
+    key = str(location).strip().lower()
+    entry = _cache.get_entry(key)
+    if entry is not None:
+        report, is_fresh = entry
+        if is_fresh:
+            return report
+        if WEATHER_STALE_WHILE_REVALIDATE:
+            _revalidate(key, location)
+            return report
+
+    return _coalesced_fetch(key, location)
@@ -0,0 +1,269 @@
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from llm.scheduler import estimate_request_tokens, scheduler
+from utils import cassette
+from utils.tracing import increment, register_collector, span
+
+MODEL = os.getenv("LLM_MODEL", "gpt-4o-mini")
+
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+
+logger = logging.getLogger(__name__)
+
+# Process-wide totals; cached_prompt_tokens are the prompt tokens served from the provider's prefix cache.
+USAGE_STATS = {
+    "requests": 0,
+    "prompt_tokens": 0,
+    "cached_prompt_tokens": 0,
+    "completion_tokens": 0,
+}
+
+_client = None
+_client_lock = threading.Lock()
+_retryable_errors = None
+
+
+def get_client():
+    """Return the pooled async client shared by every agent in the process, creating it on first use.
+
+    openai and httpx are imported here rather than at module import to keep cold start short;
+    async code should go through warm_client() so that import never runs on the event loop.
+    Retries are handled here (with the scheduler) rather than inside the SDK.
+    """
+    global _client
+    with _client_lock:
+        if _client is not None:
+            return _client
+        import httpx
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+        _client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            timeout=LLM_TIMEOUT,
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=LLM_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+                ),
+            ),
+        )
+        return _client
+
+
+async def warm_client():
+    """Return the shared client, building it in a worker thread the first time."""
+    return _client or await asyncio.to_thread(get_client)
+
+
+def retryable_errors():
+    """Transient OpenAI errors worth retrying; only evaluated once an exception is being handled."""
+    global _retryable_errors
+    if _retryable_errors is None:
+        import openai
+
+        _retryable_errors = (
+            openai.RateLimitError,
+            openai.APITimeoutError,
+            openai.APIConnectionError,
+            openai.InternalServerError,
+        )
+    return _retryable_errors
+
+
+async def _create(**request):
+    client = await warm_client()
+    return await client.chat.completions.create(**request)
+
+
+def _usage_metrics():
+    return [f"secret_agents_llm_{key}_total {value}" for key, value in USAGE_STATS.items()] + [
+        f"secret_agents_llm_queued_requests {scheduler.queued()}",
+    ]
+
+
+register_collector(_usage_metrics)
+
+
+_usage_meter = contextvars.ContextVar("llm_usage_meter", default=None)
+
+
+def start_usage_meter():
+    """Count the tokens of every LLM call made later in this context into the returned dict."""
+    meter = {"prompt_tokens": 0, "completion_tokens": 0}
+    _usage_meter.set(meter)
+    return meter
+
+
+def record_usage(usage):
+    """Add one response's token usage to USAGE_STATS and return (prompt, cached, completion) tokens."""
+    if usage is None:
+        return 0, 0, 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = (getattr(details, "cached_tokens", None) or 0) if details else 0
+    USAGE_STATS["requests"] += 1
+    USAGE_STATS["prompt_tokens"] += usage.prompt_tokens
+    USAGE_STATS["cached_prompt_tokens"] += cached
+    USAGE_STATS["completion_tokens"] += usage.completion_tokens
+    meter = _usage_meter.get()
+    if meter is not None:
+        meter["prompt_tokens"] += usage.prompt_tokens
+        meter["completion_tokens"] += usage.completion_tokens
+    logger.info(
+        "LLM usage: %d prompt tokens (%d cached, %d uncached), %d completion tokens",
+        usage.prompt_tokens, cached, usage.prompt_tokens - cached, usage.completion_tokens,
+    )
+    return usage.prompt_tokens, cached, usage.completion_tokens
+
+
+def _retry_delay(error, attempt):
+    """Full-jitter exponential backoff, never shorter than the server's retry-after hint."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    retry_after = 0.0
+    try:
+        if headers.get("retry-after-ms"):
+            retry_after = float(headers["retry-after-ms"]) / 1000
+        elif headers.get("retry-after"):
+            retry_after = float(headers["retry-after"])
+    except ValueError:
+        pass
+    backoff = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+    return max(retry_after, backoff)
+
+
+async def _backoff(error, attempt):
+    delay = _retry_delay(error, attempt)
+    increment("llm_retries", reason=type(error).__name__)
+    logger.warning("LLM request failed with %s; retry %d in %.2fs", type(error).__name__, attempt + 1, delay)
+    await asyncio.sleep(delay)
+
+
+async def chat_completion(**kwargs):
+    """Create a chat completion through the process-wide scheduler, retrying transient failures."""
+    kwargs.setdefault("model", MODEL)
+    estimated = estimate_request_tokens(kwargs)
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        with span("llm.request", model=kwargs["model"], stream=False, attempt=attempt) as request_span:
+            queued_at = time.perf_counter()
+            await scheduler.acquire(estimated)
+            request_span.set(queue_ms=round((time.perf_counter() - queued_at) * 1000, 3))
+            used = 0
+            try:
+                response = await cassette.llm_create(_create, kwargs)
+                prompt, cached, completion = record_usage(response.usage)
+                used = prompt + completion
+                request_span.set(prompt_tokens=prompt, cached_tokens=cached, completion_tokens=completion)
+                return response
+            except retryable_errors() as e:
+                if attempt == LLM_MAX_RETRIES:
+                    raise
+                error = e
+            finally:
+                scheduler.release(used, estimated)
+        await _backoff(error, attempt)
+
+
+def _reply(content, tool_calls):
+    if not tool_calls:
+        return content
+
+    return {
+        "assistant_message": {
+            "role": "assistant",
+            "content": content,
+            "tool_calls": [
+                {
+                    "id": tc["id"],
+                    "type": "function",
+                    "function": {"name": tc["name"], "arguments": tc["arguments"]},
+                }
+                for tc in tool_calls
+            ],
+        },
+        "tool_calls": tool_calls,
+    }
+
+
+def parse_choice(choice):
+    """Return the reply text, or a dict with the assistant message and every tool call it requested."""
+    message = choice.message
+    if choice.finish_reason != "tool_calls" or not message.tool_calls:
+        return message.content
+
+    return _reply(message.content, [
+        {"id": tc.id, "name": tc.function.name, "arguments": tc.function.arguments}
+        for tc in message.tool_calls
+    ])
+
+
+async def stream_completion(on_token, **kwargs):
+    """Stream a chat completion, awaiting on_token for each text delta, and return what parse_choice would.
+
+    Transient failures are retried only until the first delta has been passed on.
+    """
+    kwargs.setdefault("model", MODEL)
+    estimated = estimate_request_tokens(kwargs)
+    content = []
+    tool_calls = {}
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        started = time.perf_counter()
+        with span("llm.request", model=kwargs["model"], stream=True, attempt=attempt) as request_span:
+            queued_at = time.perf_counter()
+            await scheduler.acquire(estimated)
+            request_span.set(queue_ms=round((time.perf_counter() - queued_at) * 1000, 3))
+            used = 0
+            try:
+                stream = await cassette.llm_create(
+                    _create,
+                    {"stream": True, "stream_options": {"include_usage": True}, **kwargs},
+                )
+                async for chunk in stream:
+                    if chunk.usage is not None:
+                        prompt, cached, completion = record_usage(chunk.usage)
+                        used = prompt + completion
+                        request_span.set(prompt_tokens=prompt, cached_tokens=cached, completion_tokens=completion)
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta
+                    if delta.content:
+                        if not content:
+                            request_span.set(first_token_ms=round((time.perf_counter() - started) * 1000, 3))
+                        content.append(delta.content)
+                        await on_token(delta.content)
+                    # Tool calls arrive as fragments keyed by index; stitch them together as they come.
+                    for fragment in delta.tool_calls or []:
+                        tc = tool_calls.setdefault(fragment.index, {"id": None, "name": "", "arguments": ""})
+                        if fragment.id:
+                            tc["id"] = fragment.id
+                        if fragment.function and fragment.function.name:
+                            tc["name"] += fragment.function.name
+                        if fragment.function and fragment.function.arguments:
+                            tc["arguments"] += fragment.function.arguments
+                return _reply("".join(content) or None, [tool_calls[i] for i in sorted(tool_calls)])
+            except retryable_errors() as e:
+                if attempt == LLM_MAX_RETRIES or content:
+                    raise
+                tool_calls.clear()
+                error = e
+            finally:
+                scheduler.release(used, estimated)
+        await _backoff(error, attempt)
+
+
+async def request_reply(on_token=None, **kwargs):
+    """Send a chat request and return parsed reply text or tool calls, streaming text to on_token if given."""
+    if on_token is not None:
+        return await stream_completion(on_token, **kwargs)
+
+    response = await chat_completion(**kwargs)
+    return parse_choice(response.choices[0])
@@ -0,0 +1,110 @@
+import logging
+import os
+import re
+from llm.client import chat_completion
+
+logger = logging.getLogger(__name__)
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+CONTEXT_KEEP_TURNS = int(os.getenv("CONTEXT_KEEP_TURNS", "3"))
+# Fold down to this share of the budget so summarisation runs rarely, not on every call.
+CONTEXT_FOLD_TARGET = float(os.getenv("CONTEXT_FOLD_TARGET", "0.6"))
+
+SUMMARY_NAME = "context_summary"
+SUMMARY_HEADER = "Summary of the earlier conversation ({folded} tokens folded):\n"
+_SUMMARY_HEADER_RE = re.compile(r"^Summary of the earlier conversation \((\d+) tokens folded\):\n")
+
+SUMMARY_PROMPT = """You maintain the running summary of a spy game conversation.
+Merge the previous summary and the new transcript into one short summary of at most 120 words.
+Keep decisions, chosen options, mission facts, gadget results and open questions. Drop small talk."""
+
+
+def estimate_tokens(message):
+    """Rough token count (~4 characters per token plus per-message overhead)."""
+    text = message.get("content") or ""
+    for tc in message.get("tool_calls") or []:
+        text += tc["function"]["name"] + tc["function"]["arguments"]
+    return len(text) // 4 + 4
+
+
+def is_summary(message):
+    return message.get("role") == "system" and message.get("name") == SUMMARY_NAME
+
+
+def _split(messages):
+    """Split into pinned system messages, the running summary, and turns that each start at a user message."""
+    pinned, summary, turns = [], None, []
+    for message in messages:
+        if is_summary(message):
+            summary = message
+        elif message.get("role") == "system" and not turns:
+            pinned.append(message)
+        elif message.get("role") == "user" or not turns:
+            turns.append([message])
+        else:
+            # Assistant tool calls and their tool results stay in the same turn.
+            turns[-1].append(message)
+    return pinned, summary, turns
+
+
+def _folded_tokens(summary):
+    match = _SUMMARY_HEADER_RE.match(summary["content"]) if summary else None
+    return int(match.group(1)) if match else 0
+
+
+def _transcript(messages):
+    lines = []
+    for message in messages:
+        if message.get("content"):
+            lines.append(f"{message['role']}: {message['content']}")
+        for tc in message.get("tool_calls") or []:
+            lines.append(f"assistant called {tc['function']['name']}({tc['function']['arguments']})")
+    return "\n".join(lines)
+
+
+async def _summarize(previous, folded):
+    transcript = _transcript(folded)
+    try:
+        response = await chat_completion(
+            messages=[
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": f"Previous summary:\n{previous or '(none)'}\n\nNew transcript:\n{transcript}"},
+            ],
+            max_tokens=200,
+        )
+        return response.choices[0].message.content
+    except Exception:
+        logger.exception("Context summarisation failed; keeping a truncated transcript instead")
+        return f"{previous}\n{transcript}"[-800:]
+
+
+async def fit_context(messages, reserved_tokens=0, budget=CONTEXT_TOKEN_BUDGET):
+    """Keep `messages` within the token budget, folding the oldest turns into a running summary.
+
+    Mutates `messages` in place and returns the number of tokens this call
+    avoids resending compared with the unbounded history.
+    """
+    pinned, summary, turns = _split(messages)
+    folded_tokens = _folded_tokens(summary)
+    total = reserved_tokens + sum(estimate_tokens(m) for m in messages)
+
+    if total > budget and len(turns) > CONTEXT_KEEP_TURNS:
+        folded = []
+        while total > budget * CONTEXT_FOLD_TARGET and len(turns) > CONTEXT_KEEP_TURNS:
+            turn = turns.pop(0)
+            folded.extend(turn)
+            total -= sum(estimate_tokens(m) for m in turn)
+
+        previous = _SUMMARY_HEADER_RE.sub("", summary["content"]) if summary else ""
+        folded_tokens += sum(estimate_tokens(m) for m in folded)
+        summary = {
+            "role": "system",
+            "name": SUMMARY_NAME,
+            "content": SUMMARY_HEADER.format(folded=folded_tokens) + await _summarize(previous, folded),
+        }
+        messages[:] = pinned + [summary] + [m for turn in turns for m in turn]
+
+    saved = folded_tokens - estimate_tokens(summary) if summary else 0
+    if saved:
+        logger.info("Context manager saved %d prompt tokens this turn", saved)
+    return saved
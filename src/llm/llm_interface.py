@@ -1,59 +1,31 @@
-import json
-import os
-from openai import OpenAI
+from llm.client import request_reply
+from llm.context import fit_context
+from llm.response_cache import cache_key, get_cached_reply, store_reply
+from utils.tool_executor import tool_schemas
 
 SYSTEM_PROMPT = """You are the Quartermaster, a witty and resourceful spy handler. 
 You assist field agents with their missions by answering questions and using your available gadgets.
 Stay in character — keep responses concise, professional, and lightly spy-themed."""
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+TOOLS = tool_schemas("weather", "decrypt_message")
 
-TOOLS = [
-    {
-        "type": "function",
-        "function": {
-            "name": "weather",
-            "description": "Get the current weather for a city.",
-            "parameters": {
-                "type": "object",
-                "properties": {"city": {"type": "string"}},
-                "required": ["city"],
-            },
-        },
-    },
-    {
-        "type": "function",
-        "function": {
-            "name": "decrypt_message",
-            "description": "Decrypt a Caesar-cipher encoded message.",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "ciphertext": {"type": "string"},
-                    "shift": {"type": "integer"},
-                },
-                "required": ["ciphertext", "shift"],
-            },
-        },
-    },
-]
 
+async def send_to_llm(messages, on_token=None, tool_choice=None):
+    await fit_context(messages)
+    key = cache_key(messages)
+    if key is not None:
+        cached = get_cached_reply(key)
+        if cached is not None:
+            if on_token is not None:
+                await on_token(cached)
+            return cached
 
-def send_to_llm(messages):
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
+    reply = await request_reply(
+        on_token,
         messages=messages,
         tools=TOOLS,
+        **({"tool_choice": tool_choice} if tool_choice else {}),
     )
-    choice = response.choices[0]
-
-    if choice.finish_reason == "tool_calls":
-        tool_call = choice.message.tool_calls[0]
-        return {
-            "tool_call_id": tool_call.id,
-            "tool": tool_call.function.name,
-            "params": json.loads(tool_call.function.arguments),
-            "assistant_message": choice.message,
-        }
-
-    return choice.message.content
+    if key is not None:
+        store_reply(key, reply)
+    return reply
@@ -0,0 +1,48 @@
+import os
+import time
+from llm.client import start_usage_meter
+
+
+def _budget(prefix, max_iterations, deadline, max_tokens, max_repeats):
+    return {
+        "max_iterations": int(os.getenv(f"{prefix}_LOOP_MAX_ITERATIONS", max_iterations)),
+        "deadline": float(os.getenv(f"{prefix}_LOOP_DEADLINE", deadline)),
+        "max_tokens": int(os.getenv(f"{prefix}_LOOP_MAX_TOKENS", max_tokens)),
+        "max_repeats": int(os.getenv(f"{prefix}_LOOP_MAX_REPEATS", max_repeats)),
+    }
+
+
+# Per-agent tool-loop budgets, keyed by the sender's name as used in the agent.* spans.
+LOOP_BUDGETS = {
+    "send_to_taskmaster": _budget("TASKMASTER", "6", "60", "20000", "1"),
+    "send_to_llm": _budget("QUARTERMASTER", "4", "30", "10000", "1"),
+}
+DEFAULT_LOOP_BUDGET = _budget("TOOL", "4", "30", "10000", "1")
+
+FALLBACK_REPLY = "Static on the line, Agent. Hold your position and try again."
+
+
+class LoopGuard:
+    """Tracks one run of the tool loop against its agent's budget."""
+
+    def __init__(self, agent):
+        self.budget = LOOP_BUDGETS.get(agent, DEFAULT_LOOP_BUDGET)
+        self.started = time.monotonic()
+        self.usage = start_usage_meter()
+        self.calls = {}
+
+    def exceeded(self, iteration, tool_calls):
+        """Return the name of the budget the next round of `tool_calls` would break, or None."""
+        budget = self.budget
+        if iteration >= budget["max_iterations"]:
+            return "iterations"
+        if time.monotonic() - self.started >= budget["deadline"]:
+            return "deadline"
+        if self.usage["prompt_tokens"] + self.usage["completion_tokens"] >= budget["max_tokens"]:
+            return "tokens"
+        for tc in tool_calls:
+            key = (tc["name"], tc["arguments"])
+            self.calls[key] = self.calls.get(key, 0) + 1
+            if self.calls[key] > budget["max_repeats"] + 1:
+                return "repeated_call"
+        return None
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+from collections import deque
+from contextlib import closing
+from llm.scheduler import BACKGROUND, set_request_context
+from llm.taskmaster import generate_mission, is_valid_mission_options
+
+logger = logging.getLogger(__name__)
+
+MISSION_BANK_SIZE = int(os.getenv("MISSION_BANK_SIZE", "12"))
+MISSION_BANK_LOW_WATER = int(os.getenv("MISSION_BANK_LOW_WATER", "4"))
+MISSION_BANK_PATH = os.getenv("MISSION_BANK_PATH")  # optional SQLite file that survives restarts
+
+# Entries are (row_id, options); row_id is None when no store is configured.
+_pool = deque()
+_loaded = False
+_refill_task = None
+_load_lock = asyncio.Lock()
+
+
+def _connect():
+    conn = sqlite3.connect(MISSION_BANK_PATH)
+    conn.execute("CREATE TABLE IF NOT EXISTS missions (id INTEGER PRIMARY KEY AUTOINCREMENT, options TEXT NOT NULL)")
+    return conn
+
+
+def _load():
+    """Return the stored (row_id, options) that are still playable, deleting any that are not."""
+    with closing(_connect()) as conn, conn:
+        rows = conn.execute("SELECT id, options FROM missions ORDER BY id LIMIT ?", (MISSION_BANK_SIZE,)).fetchall()
+        valid = []
+        for row_id, options in rows:
+            try:
+                options = json.loads(options)
+            except json.JSONDecodeError:
+                options = None
+            if is_valid_mission_options(options):
+                valid.append((row_id, options))
+            else:
+                logger.warning("Dropping invalid stored mission option set %s", row_id)
+                conn.execute("DELETE FROM missions WHERE id = ?", (row_id,))
+    return valid
+
+
+async def _ensure_loaded():
+    global _loaded
+    async with _load_lock:
+        if _loaded:
+            return
+        if MISSION_BANK_PATH:
+            _pool.extend(await asyncio.to_thread(_load))
+        _loaded = True
+
+
+def _store(options):
+    if not MISSION_BANK_PATH:
+        return None
+    with closing(_connect()) as conn, conn:
+        return conn.execute("INSERT INTO missions (options) VALUES (?)", (json.dumps(options),)).lastrowid
+
+
+def _claim(row_id):
+    """Delete a stored row; False means another worker sharing the store already took it."""
+    if row_id is None:
+        return True
+    with closing(_connect()) as conn, conn:
+        return conn.execute("DELETE FROM missions WHERE id = ?", (row_id,)).rowcount == 1
+
+
+async def _refill():
+    set_request_context(session_id="mission_bank", priority=BACKGROUND)
+    failures = 0
+    while len(_pool) < MISSION_BANK_SIZE and failures < 3:
+        try:
+            options = (await generate_mission()).get("options", [])
+        except Exception:
+            logger.exception("Mission bank refill failed")
+            failures += 1
+            continue
+        if not is_valid_mission_options(options):
+            logger.warning("Discarding invalid mission option set")
+            failures += 1
+            continue
+        failures = 0
+        row_id = await asyncio.to_thread(_store, options)
+        _pool.append((row_id, options))
+
+
+async def ensure_refill():
+    """Start a background refill if the pool is at or below its low-water mark."""
+    global _refill_task
+    await _ensure_loaded()
+    if len(_pool) > MISSION_BANK_LOW_WATER:
+        return
+    if _refill_task is None or _refill_task.done():
+        _refill_task = asyncio.create_task(_refill())
+
+
+async def take_mission_options():
+    """Pop a ready option set from the pool, or return None when it is empty."""
+    await _ensure_loaded()
+    options = None
+    while _pool and options is None:
+        row_id, candidate = _pool.popleft()
+        if row_id is None or await asyncio.to_thread(_claim, row_id):
+            options = candidate
+    await ensure_refill()
+    return options
@@ -0,0 +1,71 @@
+import hashlib
+import json
+import os
+import re
+from utils.tracing import register_collector
+from utils.ttl_cache import TTLCache
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1") == "1"
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+
+CACHE_STATS = {"hits": 0, "misses": 0, "bypassed": 0}
+
+_cache = TTLCache(RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL)
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def _normalize(text):
+    return _WHITESPACE_RE.sub(" ", (text or "").lower()).strip(" ?!.")
+
+
+def cache_key(messages):
+    """Key on the whole conversation, or None when the reply must not be cached.
+
+    Every message (including context summaries) is part of the key, so a reply
+    is only reused for an identical conversation, typically the same opening
+    question from different players. Conversations that involve tool calls or
+    tool results anywhere are never cached, since those replies depend on live
+    gadget output.
+    """
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    if (
+        not messages
+        or messages[-1].get("role") != "user"
+        or any(m.get("role") == "tool" or m.get("tool_calls") for m in messages)
+    ):
+        CACHE_STATS["bypassed"] += 1
+        return None
+
+    payload = json.dumps(
+        [[m.get("role"), m.get("name"), _normalize(m.get("content"))] for m in messages],
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def get_cached_reply(key):
+    reply = _cache.get(key)
+    CACHE_STATS["hits" if reply is not None else "misses"] += 1
+    return reply
+
+
+def store_reply(key, reply):
+    # Only plain text replies are cached; tool-calling responses are always recomputed.
+    if isinstance(reply, str) and reply:
+        _cache.set(key, reply)
+
+
+def _cache_metrics():
+    lookups = CACHE_STATS["hits"] + CACHE_STATS["misses"]
+    return [
+        f"secret_agents_response_cache_hits_total {CACHE_STATS['hits']}",
+        f"secret_agents_response_cache_misses_total {CACHE_STATS['misses']}",
+        f"secret_agents_response_cache_bypassed_total {CACHE_STATS['bypassed']}",
+        f"secret_agents_response_cache_hit_ratio {CACHE_STATS['hits'] / lookups if lookups else 0.0}",
+        f"secret_agents_response_cache_entries {len(_cache)}",
+    ]
+
+
+register_collector(_cache_metrics)
@@ -0,0 +1,140 @@
+import asyncio
+import contextvars
+import os
+import time
+from collections import OrderedDict, deque
+
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "64"))
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))  # 0 disables the limit
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))  # 0 disables the limit
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+_session_id = contextvars.ContextVar("llm_session_id", default="global")
+_priority = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+
+
+def set_request_context(session_id=None, priority=None):
+    """Tag LLM requests made later in this context with a session (for fair queuing) and a priority."""
+    if session_id is not None:
+        _session_id.set(session_id)
+    if priority is not None:
+        _priority.set(priority)
+
+
+def estimate_request_tokens(request):
+    """Rough prompt + completion token estimate used to charge the tokens-per-minute bucket up front."""
+    chars = sum(len(m.get("content") or "") for m in request.get("messages", []))
+    return chars // 4 + (request.get("max_tokens") or 512)
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` can be taken (requests larger than the bucket only wait for a full one)."""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        # May go negative when correcting an estimate upwards; the deficit is repaid by refills.
+        self._refill()
+        self.level -= amount
+
+
+class LLMScheduler:
+    """Process-wide gate for LLM requests.
+
+    Requests wait for a free in-flight slot and for room in the request and
+    token buckets. Interactive requests always go before background ones, and
+    within a priority sessions are served round-robin so one busy session
+    cannot starve the rest.
+    """
+
+    def __init__(self, max_in_flight=LLM_MAX_IN_FLIGHT, requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=LLM_TOKENS_PER_MINUTE):
+        self.available = max_in_flight
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        # One queue per priority: session id -> deque of (future, estimated tokens), in round-robin order.
+        self.queues = (OrderedDict(), OrderedDict())
+        self._timer = None
+
+    def queued(self):
+        return sum(len(waiters) for queue in self.queues for waiters in queue.values())
+
+    async def acquire(self, estimated_tokens):
+        future = asyncio.get_running_loop().create_future()
+        self.queues[_priority.get()].setdefault(_session_id.get(), deque()).append((future, estimated_tokens))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # The slot was granted just as the caller was cancelled; hand it back.
+                self.release()
+            raise
+
+    def release(self, actual_tokens=0, estimated_tokens=0):
+        self.available += 1
+        if self.tokens is not None and actual_tokens:
+            self.tokens.take(actual_tokens - estimated_tokens)
+        self._dispatch()
+
+    def _head(self):
+        for queue in self.queues:
+            while queue:
+                session_id, waiters = next(iter(queue.items()))
+                while waiters and waiters[0][0].cancelled():
+                    waiters.popleft()
+                if waiters:
+                    return queue, session_id, waiters
+                del queue[session_id]
+        return None
+
+    def _dispatch(self):
+        while self.available > 0:
+            head = self._head()
+            if head is None:
+                return
+            queue, session_id, waiters = head
+            future, estimated_tokens = waiters[0]
+
+            wait = max(
+                self.requests.wait_time(1) if self.requests else 0.0,
+                self.tokens.wait_time(estimated_tokens) if self.tokens else 0.0,
+            )
+            if wait > 0:
+                if self._timer is None:
+                    self._timer = asyncio.get_running_loop().call_later(wait, self._on_timer)
+                return
+
+            waiters.popleft()
+            if waiters:
+                queue.move_to_end(session_id)
+            else:
+                del queue[session_id]
+            if self.requests:
+                self.requests.take(1)
+            if self.tokens:
+                self.tokens.take(estimated_tokens)
+            self.available -= 1
+            future.set_result(None)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+
+scheduler = LLMScheduler()
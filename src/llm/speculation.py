@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import os
+from gadgets.weather import get_weather
+from utils.tracing import increment
+
+logger = logging.getLogger(__name__)
+
+SPECULATIVE_BRIEFINGS = os.getenv("SPECULATIVE_BRIEFINGS", "0") == "1"
+# Estimated tokens one session may spend on briefings the player might never pick.
+SPECULATION_TOKEN_BUDGET = int(os.getenv("SPECULATION_TOKEN_BUDGET", "8000"))
+SPECULATION_COMPLETION_TOKENS = int(os.getenv("SPECULATION_COMPLETION_TOKENS", "400"))
+
+# session id -> {"base": messages the speculation started from, "tasks": {key: task}, "weather": {key: task}}
+_speculations = {}
+_spent = {}
+# Weather lookups handed off after a choice; referenced here until they finish so they are not collected.
+_detached = set()
+
+
+def charge(session_id, tokens):
+    """Reserve `tokens` of the session's speculation budget; False once the ceiling would be exceeded."""
+    spent = _spent.get(session_id, 0)
+    if spent + tokens > SPECULATION_TOKEN_BUDGET:
+        increment("speculation_skipped", reason="budget")
+        return False
+    _spent[session_id] = spent + tokens
+    return True
+
+
+def warm_weather(location):
+    """Fetch the weather in a worker thread so a later lookup for `location` is served from the cache."""
+
+    async def fetch():
+        try:
+            await asyncio.to_thread(get_weather, location)
+        except Exception:
+            logger.debug("Speculative weather lookup for %s failed", location, exc_info=True)
+
+    return asyncio.create_task(fetch())
+
+
+def start(session_id, base_messages, tasks, weather):
+    """Track briefing and weather tasks keyed by the choice they speculate on, replacing any earlier set."""
+    cancel(session_id)
+    _speculations[session_id] = {"base": base_messages, "tasks": tasks, "weather": weather}
+    increment("speculative_briefings", len(tasks), outcome="started")
+
+
+def take(session_id, key, messages):
+    """Return the task for `key` and cancel the rest.
+
+    Returns None when nothing was speculated for `key`, or when the
+    conversation has moved on since the speculation started.
+    """
+    speculation = _speculations.pop(session_id, None)
+    if speculation is None:
+        return None
+    winner = speculation["tasks"].pop(key, None)
+    if speculation["base"] != messages:
+        speculation["tasks"][key] = winner
+        winner = None
+    # The chosen city's weather is about to be asked for, so let its lookup finish.
+    lookup = speculation["weather"].pop(key, None)
+    if winner is not None and lookup is not None and not lookup.done():
+        _detached.add(lookup)
+        lookup.add_done_callback(_detached.discard)
+    elif lookup is not None:
+        lookup.cancel()
+    for task in speculation["weather"].values():
+        task.cancel()
+    for task in speculation["tasks"].values():
+        if task is not None and not task.done():
+            task.cancel()
+            increment("speculative_briefings", outcome="cancelled")
+        elif task is not None:
+            if not task.cancelled() and task.exception() is not None:
+                # Retrieve it so asyncio does not log "Task exception was never retrieved".
+                logger.debug("Discarded speculative briefing failed", exc_info=task.exception())
+            increment("speculative_briefings", outcome="wasted")
+    return winner
+
+
+def cancel(session_id):
+    """Cancel every outstanding speculation of a session."""
+    speculation = _speculations.pop(session_id, None)
+    if speculation is None:
+        return
+    for task in list(speculation["tasks"].values()) + list(speculation["weather"].values()):
+        task.cancel()
+
+
+def forget(session_id):
+    cancel(session_id)
+    _spent.pop(session_id, None)
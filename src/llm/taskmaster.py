@@ -1,10 +1,14 @@
 import json
-import os
-from openai import OpenAI
+import logging
+import re
+from llm.client import request_reply, stream_completion
+from llm.context import estimate_tokens, fit_context
 from llm.llm_interface import TOOLS
 from gadgets.decryptor import encrypt_message
+from utils.tool_executor import tool_schemas
+from utils.tracing import span
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+logger = logging.getLogger(__name__)
 
 TASKMASTER_PERSONA = """You are the Taskmaster, a shadowy spymaster who runs field agents through covert missions.
 You manage a strict four-phase mission sequence: travel -> briefing -> crack_code -> complete.
@@ -47,45 +51,21 @@ Deliver a short debrief and mission rating.
 Close the operation cleanly.""",
 }
 
-UPDATE_GAME_PHASE_TOOL = {
-    "type": "function",
-    "function": {
-        "name": "update_game_phase",
-        "description": "Advance the mission to the next phase once the player has completed the current one.",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "phase": {
-                    "type": "string",
-                    "enum": ["briefing", "crack_code", "complete"],
-                }
-            },
-            "required": ["phase"],
-        },
-    },
-}
+UPDATE_GAME_PHASE_TOOL, SELECT_MISSION_TOOL = tool_schemas("update_game_phase", "select_mission")
 
-SELECT_MISSION_TOOL = {
-    "type": "function",
-    "function": {
-        "name": "select_mission",
-        "description": "Confirm the selected mission and save its details to the game state.",
-        "parameters": {
-            "type": "object",
-            "properties": {
-                "location": {"type": "string"},
-                "cipher": {"type": "string"},
-                "shift": {"type": "integer"},
-            },
-            "required": ["location", "cipher", "shift"],
-        },
-    },
+TASKMASTER_TOOLS = TOOLS + [UPDATE_GAME_PHASE_TOOL, SELECT_MISSION_TOOL]
+
+# Built once at import so every request for a phase starts with a byte-identical prefix.
+BASE_SYSTEM_MESSAGE = {"role": "system", "content": f"{TASKMASTER_PERSONA}\n"}
+PHASE_SYSTEM_MESSAGES = {
+    phase: {"role": "system", "content": f"{TASKMASTER_PERSONA}\n{instruction}"}
+    for phase, instruction in PHASE_PROMPTS.items()
 }
 
-TASKMASTER_TOOLS = TOOLS + [UPDATE_GAME_PHASE_TOOL, SELECT_MISSION_TOOL]
+MISSION_FIELDS = ("location", "description", "cipher", "shift_hint")
 
 MISSION_GENERATION_PROMPT = """You are a spy mission generator. Return ONLY valid JSON — no markdown, no explanation.
-Generate 3 distinct mission options. Return them in a list under the key 'options'.
+Generate the requested number of distinct mission options. Return them in a list under the key 'options'.
 Each mission must have these fields:
 {
   "location": "<a real world city>",
@@ -95,28 +75,154 @@ Each mission must have these fields:
   "shift_hint": "<a short spy-flavoured phrase hinting at the shift value, without stating the number as a digit>"
 }"""
 
+MISSION_OPTION_COUNT = 3
+MISSION_GENERATION_ATTEMPTS = 3
 
-def generate_mission():
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": MISSION_GENERATION_PROMPT},
-            {"role": "user", "content": "Generate 3 new mission options."},
-        ],
-    )
-    data = json.loads(response.choices[0].message.content)
-    for option in data.get("options", []):
+# Structured output keeps every option on the schema; fields are still validated as they stream in.
+MISSION_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "mission_options",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "options": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "location": {"type": "string"},
+                            "description": {"type": "string"},
+                            "plaintext": {"type": "string"},
+                            "shift": {"type": "integer"},
+                            "shift_hint": {"type": "string"},
+                        },
+                        "required": ["location", "description", "plaintext", "shift", "shift_hint"],
+                        "additionalProperties": False,
+                    },
+                }
+            },
+            "required": ["options"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+_OPTIONS_START_RE = re.compile(r'"options"\s*:\s*\[')
+_SEPARATOR_RE = re.compile(r"[\s,]*")
+
+
+class OptionStreamParser:
+    """Incrementally pull complete option objects out of a streamed {"options": [...]} document."""
+
+    def __init__(self):
+        self.buffer = ""
+        self.position = None
+        self.decoder = json.JSONDecoder()
+
+    def feed(self, text):
+        """Add streamed text and return the option objects completed by it."""
+        self.buffer += text
+        if self.position is None:
+            match = _OPTIONS_START_RE.search(self.buffer)
+            if match is None:
+                return []
+            self.position = match.end()
+
+        completed = []
+        while True:
+            position = _SEPARATOR_RE.match(self.buffer, self.position).end()
+            if position >= len(self.buffer) or self.buffer[position] == "]":
+                break
+            try:
+                option, end = self.decoder.raw_decode(self.buffer, position)
+            except json.JSONDecodeError:
+                # The object is still arriving.
+                break
+            completed.append(option)
+            self.position = end
+        return completed
+
+
+def prepare_option(option):
+    """Clamp the shift, replace the plaintext with its cipher and return the option, or None if invalid."""
+    if not isinstance(option, dict):
+        return None
+    try:
         # Ensure shift is within the valid 1-5 range
-        original_shift = option.get("shift", 1)
-        clamped_shift = max(1, min(5, int(original_shift)))
-        option["shift"] = clamped_shift
-        
-        plaintext = option.pop("plaintext", "")
-        option["cipher"] = encrypt_message(plaintext, option["shift"])
-    return data
+        option["shift"] = max(1, min(5, int(option.get("shift", 1))))
+    except (TypeError, ValueError):
+        return None
+
+    plaintext = option.pop("plaintext", "")
+    if not isinstance(plaintext, str) or not plaintext.strip():
+        return None
+    option["cipher"] = encrypt_message(plaintext, option["shift"])
+    return option if is_valid_option(option) else None
+
+
+async def generate_mission(on_option=None):
+    """Generate mission options, awaiting on_option for each one as soon as it is complete and valid.
+
+    Invalid or missing options are regenerated on their own rather than
+    discarding the whole set.
+    """
+    options = []
+    requests = 0
+    with span("mission.generate") as generate_span:
+        while len(options) < MISSION_OPTION_COUNT and requests < MISSION_GENERATION_ATTEMPTS:
+            missing = MISSION_OPTION_COUNT - len(options)
+            requests += 1
+            parser = OptionStreamParser()
+            taken = {option["location"].lower() for option in options}
+
+            async def on_token(text):
+                for raw in parser.feed(text):
+                    option = prepare_option(raw)
+                    if option is None or option["location"].lower() in taken or len(options) == MISSION_OPTION_COUNT:
+                        continue
+                    taken.add(option["location"].lower())
+                    options.append(option)
+                    if on_option is not None:
+                        await on_option(option)
 
+            request = f"Generate {missing} new mission options."
+            if options:
+                request += " Do not reuse these cities: " + ", ".join(option["location"] for option in options) + "."
+            await stream_completion(
+                on_token,
+                messages=[
+                    {"role": "system", "content": MISSION_GENERATION_PROMPT},
+                    {"role": "user", "content": request},
+                ],
+                response_format=MISSION_RESPONSE_FORMAT,
+            )
+        generate_span.set(attempts=requests, options=len(options))
 
-def send_to_taskmaster(messages, game_state):
+    if len(options) < MISSION_OPTION_COUNT:
+        logger.warning("Mission generation produced only %d valid options", len(options))
+    return {"options": options}
+
+
+def is_valid_option(option):
+    return (
+        isinstance(option, dict)
+        and all(isinstance(option.get(field), str) and option[field].strip() for field in MISSION_FIELDS)
+        and option.get("shift") in {1, 2, 3, 4, 5}
+    )
+
+
+def is_valid_mission_options(options):
+    """Check that a generated option set is complete enough to be played."""
+    return (
+        isinstance(options, list)
+        and len(options) == MISSION_OPTION_COUNT
+        and all(is_valid_option(option) for option in options)
+    )
+
+
+def _render_state(game_state):
     mission = game_state.get("current_mission", {})
     phase = mission.get("phase", "travel")
     options = game_state.get("mission_options", [])
@@ -135,7 +241,7 @@ def send_to_taskmaster(messages, game_state):
             f"  Shift Hint: {mission.get('shift_hint', 'pending')}\n"
         )
     )
-    state_summary = (
+    return (
         f"Mission Options:\n{options_summary}\n\n"
         f"Current mission state:\n"
         f"  Phase: {phase}\n"
@@ -145,25 +251,31 @@ def send_to_taskmaster(messages, game_state):
         f"  Completed phases: {mission.get('completed_phases', [])}"
     )
 
-    phase_instruction = PHASE_PROMPTS.get(phase, "")
-    system_prompt = f"{TASKMASTER_PERSONA}\n{phase_instruction}\n\n{state_summary}"
 
-    full_messages = [{"role": "system", "content": system_prompt}] + messages
+def state_prompt(game_state):
+    """Return the rendered state block, re-rendering only when execute_tool has bumped the state version."""
+    version = game_state.get("version", 0)
+    cached = game_state.get("_state_prompt")
+    if cached is None or cached[0] != version:
+        cached = game_state["_state_prompt"] = (version, _render_state(game_state))
+    return cached[1]
+
+
+async def send_to_taskmaster(messages, game_state, on_token=None, tool_choice=None):
+    phase = game_state.get("current_mission", {}).get("phase", "travel")
+    # Static persona/phase prefix first and the volatile state last, so the
+    # provider can reuse its prefix cache across calls and state changes.
+    state_message = {"role": "system", "content": state_prompt(game_state)}
+    static_message = PHASE_SYSTEM_MESSAGES.get(phase, BASE_SYSTEM_MESSAGE)
+    await fit_context(
+        messages,
+        reserved_tokens=estimate_tokens(static_message) + estimate_tokens(state_message),
+    )
+    full_messages = [static_message] + messages + [state_message]
 
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
+    return await request_reply(
+        on_token,
         messages=full_messages,
         tools=TASKMASTER_TOOLS,
+        **({"tool_choice": tool_choice} if tool_choice else {}),
     )
-    choice = response.choices[0]
-
-    if choice.finish_reason == "tool_calls":
-        tool_call = choice.message.tool_calls[0]
-        return {
-            "tool_call_id": tool_call.id,
-            "tool": tool_call.function.name,
-            "params": json.loads(tool_call.function.arguments),
-            "assistant_message": choice.message,
-        }
-
-    return choice.message.content
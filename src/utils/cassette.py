@@ -0,0 +1,146 @@
+"""Record/replay of upstream traffic (LLM completions and weather lookups) to on-disk cassettes.
+
+CASSETTE_MODE=record appends every request/response pair to CASSETTE_PATH;
+CASSETTE_MODE=replay serves them back without touching the network, keyed by a
+hash of the normalised request, so a recorded mission can be re-run
+deterministically for profiling.
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off")  # "off", "record" or "replay"
+CASSETTE_PATH = os.getenv("CASSETTE_PATH", "cassettes/session.jsonl.gz")
+CASSETTE_REPLAY_LATENCY = os.getenv("CASSETTE_REPLAY_LATENCY", "original")  # "original" or "zero"
+
+_lock = threading.Lock()
+_tapes = None  # key -> [entries, next index]
+
+
+class CassetteMiss(LookupError):
+    """Raised in replay mode for a request that was never recorded."""
+
+
+def _open(mode):
+    return gzip.open(CASSETTE_PATH, mode + "t", encoding="utf-8") if CASSETTE_PATH.endswith(".gz") \
+        else open(CASSETTE_PATH, mode, encoding="utf-8")
+
+
+def _normalise(kind, request):
+    if kind != "llm":
+        return request
+    # Tool call ids are random per run; number them in order of appearance instead.
+    ids = {}
+    messages = []
+    for message in request.get("messages", []):
+        message = dict(message)
+        if message.get("tool_calls"):
+            message["tool_calls"] = [
+                {**tc, "id": ids.setdefault(tc["id"], f"call_{len(ids)}")} for tc in message["tool_calls"]
+            ]
+        if "tool_call_id" in message:
+            message["tool_call_id"] = ids.setdefault(message["tool_call_id"], f"call_{len(ids)}")
+        messages.append(message)
+    return {**request, "messages": messages}
+
+
+def request_key(kind, request):
+    blob = json.dumps([kind, _normalise(kind, request)], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+def _record(kind, request, entry):
+    line = json.dumps({"key": request_key(kind, request), "kind": kind, **entry}, separators=(",", ":"))
+    with _lock:
+        directory = os.path.dirname(CASSETTE_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with _open("a") as f:
+            f.write(line + "\n")
+
+
+def _lookup(kind, request):
+    """Return the next recorded entry for `request`; repeats of one request replay in recorded order."""
+    global _tapes
+    with _lock:
+        if _tapes is None:
+            _tapes = {}
+            with _open("r") as f:
+                for line in f:
+                    entry = json.loads(line)
+                    _tapes.setdefault(entry["key"], [[], 0])[0].append(entry)
+            logger.info("Loaded %d recorded requests from %s", sum(len(t[0]) for t in _tapes.values()), CASSETTE_PATH)
+        tape = _tapes.get(request_key(kind, request))
+        if tape is None:
+            raise CassetteMiss(f"No recorded {kind} response for this request in {CASSETTE_PATH}")
+        entries, index = tape
+        tape[1] = (index + 1) % len(entries)
+        return entries[index]
+
+
+def _replay_delay(seconds):
+    return seconds if CASSETTE_REPLAY_LATENCY == "original" else 0.0
+
+
+def call(kind, request, fetch):
+    """Run the blocking `fetch()` for `request`, recording or replaying its JSON-serialisable result."""
+    if CASSETTE_MODE == "replay":
+        entry = _lookup(kind, request)
+        time.sleep(_replay_delay(entry["latency"]))
+        return entry["result"]
+
+    started = time.perf_counter()
+    result = fetch()
+    if CASSETTE_MODE == "record":
+        _record(kind, request, {"latency": round(time.perf_counter() - started, 4), "result": result})
+    return result
+
+
+async def llm_create(create, request):
+    """Wrap a chat.completions.create call; streamed responses are recorded chunk by chunk with their timing."""
+    if CASSETTE_MODE == "replay":
+        entry = _lookup("llm", request)
+        if "chunks" in entry:
+            return _replay_stream(entry["chunks"])
+        from openai.types.chat import ChatCompletion
+
+        await asyncio.sleep(_replay_delay(entry["latency"]))
+        return ChatCompletion.model_validate(entry["response"])
+
+    started = time.perf_counter()
+    response = await create(**request)
+    if CASSETTE_MODE != "record":
+        return response
+    if request.get("stream"):
+        return _record_stream(request, response, started)
+    _record("llm", request, {
+        "latency": round(time.perf_counter() - started, 4),
+        "response": response.model_dump(mode="json", exclude_unset=True),
+    })
+    return response
+
+
+async def _record_stream(request, stream, started):
+    chunks = []
+    async for chunk in stream:
+        chunks.append([round(time.perf_counter() - started, 4), chunk.model_dump(mode="json", exclude_unset=True)])
+        yield chunk
+    _record("llm", request, {"chunks": chunks})
+
+
+async def _replay_stream(chunks):
+    from openai.types.chat import ChatCompletionChunk
+
+    started = time.perf_counter()
+    for offset, data in chunks:
+        delay = started + _replay_delay(offset) - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        yield ChatCompletionChunk.model_validate(data)
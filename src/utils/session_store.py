@@ -0,0 +1,154 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")  # "memory" or "sqlite"
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")
+SESSION_MAX_ENTRIES = int(os.getenv("SESSION_MAX_ENTRIES", "10000"))
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", "3600"))
+
+
+def dumps(value):
+    """Serialise compactly, dropping top-level keys that start with '_' (derived caches such as _state_prompt)."""
+    if isinstance(value, dict):
+        value = {key: item for key, item in value.items() if not key.startswith("_")}
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+class MemoryStore:
+    """Per-process store: LRU-bounded by entry count and evicting sessions idle for longer than idle_ttl."""
+
+    def __init__(self, max_entries=SESSION_MAX_ENTRIES, idle_ttl=SESSION_IDLE_TTL):
+        self.max_entries = max_entries
+        self.idle_ttl = idle_ttl
+        self._entries = OrderedDict()  # (session_id, key) -> (serialised value, last access)
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        # Entries are kept in access order, so idle ones are always at the front.
+        while self._entries:
+            _, (_, last_access) = next(iter(self._entries.items()))
+            if now - last_access <= self.idle_ttl and len(self._entries) <= self.max_entries:
+                break
+            self._entries.popitem(last=False)
+
+    def get(self, session_id, key):
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            entry = self._entries.get((session_id, key))
+            if entry is None:
+                return None
+            self._entries[(session_id, key)] = (entry[0], now)
+            self._entries.move_to_end((session_id, key))
+        return json.loads(entry[0])
+
+    def set(self, session_id, key, value):
+        now = time.monotonic()
+        blob = dumps(value)
+        with self._lock:
+            self._entries[(session_id, key)] = (blob, now)
+            self._entries.move_to_end((session_id, key))
+            self._evict(now)
+
+    def delete(self, session_id):
+        with self._lock:
+            for entry_key in [k for k in self._entries if k[0] == session_id]:
+                del self._entries[entry_key]
+
+
+class SQLiteStore:
+    """Store shared by every worker process on the host, surviving restarts."""
+
+    def __init__(self, path=SESSION_DB_PATH, idle_ttl=SESSION_IDLE_TTL):
+        self.path = path
+        self.idle_ttl = idle_ttl
+        self._local = threading.local()
+        self._writes = 0
+        with closing(sqlite3.connect(path)) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (session_id, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated_at ON sessions (updated_at)")
+            conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=5)
+        return conn
+
+    def get(self, session_id, key):
+        conn = self._conn()
+        with conn:
+            row = conn.execute(
+                "SELECT value FROM sessions WHERE session_id = ? AND key = ? AND updated_at >= ?",
+                (session_id, key, time.time() - self.idle_ttl),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE sessions SET updated_at = ? WHERE session_id = ? AND key = ?",
+                    (time.time(), session_id, key),
+                )
+        return None if row is None else json.loads(row[0])
+
+    def set(self, session_id, key, value):
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                (session_id, key, dumps(value), time.time()),
+            )
+            self._writes += 1
+            if self._writes % 500 == 0:
+                conn.execute("DELETE FROM sessions WHERE updated_at < ?", (time.time() - self.idle_ttl,))
+
+    def delete(self, session_id):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+
+_store = None
+
+
+def get_session_store():
+    """Return the process-wide store selected by SESSION_STORE."""
+    global _store
+    if _store is None:
+        _store = SQLiteStore() if SESSION_STORE == "sqlite" else MemoryStore()
+    return _store
+
+
+async def load(session_id, key):
+    """Read a value from the process-wide store; SQLite I/O runs in a worker thread, off the event loop."""
+    store = get_session_store()
+    if isinstance(store, SQLiteStore):
+        return await asyncio.to_thread(store.get, session_id, key)
+    return store.get(session_id, key)
+
+
+async def save(session_id, key, value):
+    """Write a value to the process-wide store; SQLite I/O runs in a worker thread, off the event loop."""
+    store = get_session_store()
+    if isinstance(store, SQLiteStore):
+        await asyncio.to_thread(store.set, session_id, key, value)
+    else:
+        store.set(session_id, key, value)
+
+
+async def delete(session_id):
+    """Drop everything stored for a session; SQLite I/O runs in a worker thread, off the event loop."""
+    store = get_session_store()
+    if isinstance(store, SQLiteStore):
+        await asyncio.to_thread(store.delete, session_id)
+    else:
+        store.delete(session_id)
@@ -1,58 +1,351 @@
+import asyncio
+import bisect
+import json
+import logging
+import os
+import threading
+import time
 from gadgets.decryptor import decrypt_message
 from gadgets.weather import get_weather
+from utils.tracing import increment, register_collector, span
+
+logger = logging.getLogger(__name__)
 
 PHASE_ORDER = ["travel", "briefing", "crack_code", "complete"]
 
+# Seconds a blocking tool may run in its worker thread before the caller gives up on it.
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", "10"))
+WEATHER_TOOL_TIMEOUT = float(os.getenv("WEATHER_TOOL_TIMEOUT", "5"))
+
+# name -> {"handler", "stateful", "timeout", "schema", "validate"}; filled by register_tool below.
+TOOL_REGISTRY = {}
+
+# Upper bounds (ms) of the per-tool latency histogram; the last bucket is unbounded.
+LATENCY_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+TOOL_STATS = {}
+_stats_lock = threading.Lock()
+
+_JSON_TYPES = {
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+    "object": dict,
+    "array": list,
+}
+
+
+def _compile_validator(schema):
+    """Turn a JSON-schema 'parameters' object into a function returning an error string or None."""
+    required = tuple(schema.get("required", ()))
+    checks = [
+        (name, spec.get("type"), _JSON_TYPES.get(spec.get("type")), frozenset(spec["enum"]) if "enum" in spec else None)
+        for name, spec in schema.get("properties", {}).items()
+    ]
+
+    def validate(parameters):
+        if not isinstance(parameters, dict):
+            return "arguments must be a JSON object"
+        for name in required:
+            if name not in parameters:
+                return f"missing required argument '{name}'"
+        for name, type_name, expected, enum in checks:
+            if name not in parameters:
+                continue
+            value = parameters[name]
+            if expected is not None and (
+                not isinstance(value, expected) or (isinstance(value, bool) and type_name != "boolean")
+            ):
+                return f"'{name}' must be of type {type_name}"
+            if enum is not None and value not in enum:
+                return f"'{name}' must be one of {sorted(enum)}"
+        return None
+
+    return validate
+
+
+def register_tool(name, description, parameters, handler, stateful=False, timeout=TOOL_TIMEOUT):
+    """Register a tool; `stateful` tools read or write game_state and are never run concurrently.
+
+    Other tools run in worker threads and are abandoned after `timeout` seconds.
+    """
+    TOOL_REGISTRY[name] = {
+        "handler": handler,
+        "stateful": stateful,
+        "timeout": timeout,
+        "schema": {
+            "type": "function",
+            "function": {"name": name, "description": description, "parameters": parameters},
+        },
+        "validate": _compile_validator(parameters),
+    }
+    TOOL_STATS[name] = {"count": 0, "errors": 0, "total_seconds": 0.0, "buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1)}
+
+
+def tool_schemas(*names):
+    """Return the OpenAI tool schemas for the given registered tools, in order."""
+    return [TOOL_REGISTRY[name]["schema"] for name in names]
+
+
+def _record_call(tool_name, seconds, failed):
+    stats = TOOL_STATS[tool_name]
+    with _stats_lock:
+        stats["count"] += 1
+        stats["errors"] += failed
+        stats["total_seconds"] += seconds
+        stats["buckets"][bisect.bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)] += 1
+
+
+def _tool_metrics():
+    lines = ["# TYPE secret_agents_tool_duration_seconds histogram"]
+    with _stats_lock:
+        snapshot = {name: {**stats, "buckets": list(stats["buckets"])} for name, stats in TOOL_STATS.items()}
+    for name, stats in snapshot.items():
+        cumulative = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS + (None,), stats["buckets"]):
+            cumulative += count
+            le = "+Inf" if bound is None else bound / 1000
+            lines.append(f'secret_agents_tool_duration_seconds_bucket{{tool="{name}",le="{le}"}} {cumulative}')
+        lines.append(f'secret_agents_tool_duration_seconds_sum{{tool="{name}"}} {stats["total_seconds"]}')
+        lines.append(f'secret_agents_tool_duration_seconds_count{{tool="{name}"}} {stats["count"]}')
+        lines.append(f'secret_agents_tool_errors_total{{tool="{name}"}} {stats["errors"]}')
+    return lines
+
+
+register_collector(_tool_metrics)
+
+
+def mark_state_changed(game_state):
+    """Bump the state version so cached prompt renderings of it are rebuilt."""
+    game_state["version"] = game_state.get("version", 0) + 1
+
+
+def _weather(parameters, game_state):
+    return get_weather(parameters.get("city"))
+
+
+def _decrypt_message(parameters, game_state):
+    return decrypt_message(parameters.get("ciphertext"), parameters.get("shift"))
+
+
+def _select_mission(parameters, game_state):
+    location = parameters.get("location")
+    cipher = parameters.get("cipher")
+    shift = parameters.get("shift")
+    mission = game_state.get("current_mission", {})
+    if (mission.get("location"), mission.get("cipher"), mission.get("shift")) == (location, cipher, shift):
+        # Already applied locally (e.g. by choose_mission_option); leave the state version alone.
+        return f"Mission already confirmed for {location}."
+
+    shift_hint = next(
+        (opt.get("shift_hint", "") for opt in game_state.get("mission_options", []) if opt.get("location") == location),
+        ""
+    )
+    mission.update({
+        "location": location,
+        "cipher": cipher,
+        "shift": shift,
+        "shift_hint": shift_hint,
+    })
+    game_state["current_mission"] = mission
+    mark_state_changed(game_state)
+    return f"Mission confirmed for {location}."
+
+
+def _update_game_phase(parameters, game_state):
+    new_phase = parameters.get("phase")
+    mission = game_state.get("current_mission", {})
+    current_phase = mission.get("phase", "travel")
+    if new_phase == current_phase:
+        return f"Phase already at: {new_phase}"
+
+    completed = mission.get("completed_phases", [])
+    if current_phase not in completed:
+        completed.append(current_phase)
+    mission["completed_phases"] = completed
+    mission["phase"] = new_phase
+    if new_phase == "complete":
+        mission["active"] = False
+    game_state["current_mission"] = mission
+    mark_state_changed(game_state)
+    return f"Phase advanced to: {new_phase}"
+
+
+register_tool(
+    "weather",
+    "Get the current weather for a city.",
+    {
+        "type": "object",
+        "properties": {"city": {"type": "string"}},
+        "required": ["city"],
+    },
+    _weather,
+    timeout=WEATHER_TOOL_TIMEOUT,
+)
+register_tool(
+    "decrypt_message",
+    "Decrypt a Caesar-cipher encoded message.",
+    {
+        "type": "object",
+        "properties": {
+            "ciphertext": {"type": "string"},
+            "shift": {"type": "integer"},
+        },
+        "required": ["ciphertext", "shift"],
+    },
+    _decrypt_message,
+)
+register_tool(
+    "update_game_phase",
+    "Advance the mission to the next phase once the player has completed the current one.",
+    {
+        "type": "object",
+        "properties": {
+            "phase": {
+                "type": "string",
+                "enum": ["briefing", "crack_code", "complete"],
+            }
+        },
+        "required": ["phase"],
+    },
+    _update_game_phase,
+    stateful=True,
+)
+register_tool(
+    "select_mission",
+    "Confirm the selected mission and save its details to the game state.",
+    {
+        "type": "object",
+        "properties": {
+            "location": {"type": "string"},
+            "cipher": {"type": "string"},
+            "shift": {"type": "integer"},
+        },
+        "required": ["location", "cipher", "shift"],
+    },
+    _select_mission,
+    stateful=True,
+)
+
 
 def execute_tool(tool_name, parameters, game_state=None):
     if game_state is None:
         game_state = {"current_mission": {}}
 
-    print(f"DEBUG: Executing tool '{tool_name}' with parameters: {parameters}")
+    tool = TOOL_REGISTRY.get(tool_name)
+    if tool is None:
+        logger.warning("Unknown tool requested: %s", tool_name)
+        return "Unknown tool requested.", game_state
 
-    if tool_name == "weather":
-        city = parameters.get("city")
-        result = get_weather(city)
+    error = tool["validate"](parameters)
+    if error is not None:
+        result = f"Invalid arguments for tool '{tool_name}': {error}"
+        _record_call(tool_name, 0.0, True)
+    else:
+        start = time.perf_counter()
+        with span("tool.call", tool=tool_name):
+            result = tool["handler"](parameters, game_state)
+        _record_call(tool_name, time.perf_counter() - start, False)
 
-    elif tool_name == "decrypt_message":
-        ciphertext = parameters.get("ciphertext")
-        shift = parameters.get("shift")
-        result = decrypt_message(ciphertext, shift)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(
+            "tool=%s parameters=%s result=%s",
+            tool_name, parameters, result,
+            extra={"tool": tool_name, "parameters": parameters, "error": error},
+        )
+    return result, game_state
 
-    elif tool_name == "select_mission":
-        location = parameters.get("location")
-        cipher = parameters.get("cipher")
-        shift = parameters.get("shift")
-        shift_hint = next(
-            (opt.get("shift_hint", "") for opt in game_state.get("mission_options", []) if opt.get("location") == location),
-            ""
+
+async def execute_tool_async(tool_name, parameters, game_state=None):
+    """Like execute_tool, but blocking tools run off the event loop and time out.
+
+    Stateful tools are quick in-memory updates and run inline. A timed-out
+    worker thread is left to finish on its own; only the caller stops waiting.
+    """
+    tool = TOOL_REGISTRY.get(tool_name)
+    if tool is None or tool["stateful"]:
+        return execute_tool(tool_name, parameters, game_state)
+
+    try:
+        return await asyncio.wait_for(
+            asyncio.to_thread(execute_tool, tool_name, parameters, game_state),
+            tool["timeout"],
         )
-        mission = game_state.get("current_mission", {})
-        mission.update({
-            "location": location,
-            "cipher": cipher,
-            "shift": shift,
-            "shift_hint": shift_hint,
-        })
-        game_state["current_mission"] = mission
-        result = f"Mission confirmed for {location}."
-
-    elif tool_name == "update_game_phase":
-        new_phase = parameters.get("phase")
-        mission = game_state.get("current_mission", {})
-        current_phase = mission.get("phase", "travel")
-        completed = mission.get("completed_phases", [])
-        if current_phase not in completed:
-            completed.append(current_phase)
-        mission["completed_phases"] = completed
-        mission["phase"] = new_phase
-        if new_phase == "complete":
-            mission["active"] = False
-        game_state["current_mission"] = mission
-        result = f"Phase advanced to: {new_phase}"
+    except asyncio.TimeoutError:
+        logger.warning("Tool %s timed out after %.1fs", tool_name, tool["timeout"])
+        increment("tool_timeouts", tool=tool_name)
+        return f"Tool '{tool_name}' did not respond in time.", game_state
 
-    else:
-        result = "Unknown tool requested."
 
-    print(f"DEBUG: Tool '{tool_name}' returned: {result}")
-    return result, game_state
+def _parse_arguments(raw_arguments):
+    try:
+        return json.loads(raw_arguments or "{}")
+    except json.JSONDecodeError:
+        return None
+
+
+def execute_tool_call(tool_name, raw_arguments, game_state=None):
+    """Parse a model-supplied JSON argument string, then validate and execute the tool."""
+    return execute_tool(tool_name, _parse_arguments(raw_arguments), game_state)
+
+
+def is_stateful(tool_name):
+    tool = TOOL_REGISTRY.get(tool_name)
+    return tool is not None and tool["stateful"]
+
+
+def choose_mission_option(game_state, number):
+    """Apply a travel-phase menu pick locally: select option `number` (1-based) and advance to briefing.
+
+    Returns (option, game_state); option is None when the pick cannot be applied.
+    """
+    mission = game_state.get("current_mission", {})
+    options = game_state.get("mission_options", [])
+    if mission.get("phase") != "travel" or not 1 <= number <= len(options):
+        return None, game_state
+
+    option = options[number - 1]
+    _, game_state = execute_tool(
+        "select_mission",
+        {"location": option["location"], "cipher": option["cipher"], "shift": option["shift"]},
+        game_state,
+    )
+    _, game_state = execute_tool("update_game_phase", {"phase": "briefing"}, game_state)
+    return option, game_state
+
+
+async def execute_tool_calls(tool_calls, game_state=None):
+    """Run every tool call of one assistant turn and return (tool_messages, game_state).
+
+    Independent tools run concurrently in worker threads while stateful tools
+    are applied one at a time in the order the model emitted them. Tool
+    messages come back in the original call order.
+    """
+    results = [None] * len(tool_calls)
+
+    async def run_independent(index, tc):
+        results[index], _ = await execute_tool_async(tc["name"], _parse_arguments(tc["arguments"]))
+
+    pending = [
+        asyncio.create_task(run_independent(index, tc))
+        for index, tc in enumerate(tool_calls)
+        if not is_stateful(tc["name"])
+    ]
+
+    for index, tc in enumerate(tool_calls):
+        if is_stateful(tc["name"]):
+            results[index], game_state = execute_tool_call(tc["name"], tc["arguments"], game_state)
+
+    if pending:
+        try:
+            await asyncio.gather(*pending)
+        except asyncio.CancelledError:
+            for task in pending:
+                task.cancel()
+            raise
+
+    tool_messages = [
+        {"role": "tool", "tool_call_id": tc["id"], "content": result}
+        for tc, result in zip(tool_calls, results)
+    ]
+    return tool_messages, game_state
@@ -0,0 +1,177 @@
+import bisect
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import os
+import threading
+import time
+
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "0") == "1"
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+
+# Upper bounds (seconds) of the span duration histogram exported on /metrics.
+DURATION_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Numeric span tags that are summed into token counters on /metrics.
+TOKEN_TAGS = ("prompt_tokens", "cached_tokens", "completion_tokens")
+
+_tags = contextvars.ContextVar("trace_tags", default={})
+_parent = contextvars.ContextVar("trace_parent", default=None)
+_span_ids = itertools.count(1)
+
+_lock = threading.Lock()
+_trace_file = None
+_span_metrics = {}
+_counters = {}
+_collectors = []
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **tags):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    def __init__(self, name, tags):
+        self.name = name
+        self.tags = tags
+        self.span_id = next(_span_ids)
+        self.parent_id = _parent.get()
+
+    def set(self, **tags):
+        self.tags.update(tags)
+
+    def __enter__(self):
+        self._token = _parent.set(self.span_id)
+        self.start = time.time()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._started
+        _parent.reset(self._token)
+        _export(self, duration, "error" if exc_type else "ok")
+        return False
+
+
+def span(name, **tags):
+    """Time a block as a span named `name`, tagged with the bound context plus `tags`.
+
+    Returns a shared no-op object when tracing is disabled.
+    """
+    if not TRACE_ENABLED:
+        return _NOOP_SPAN
+    return Span(name, {**_tags.get(), **tags})
+
+
+def bind(**tags):
+    """Attach tags (session id, phase, ...) to every span started later in this context."""
+    if TRACE_ENABLED:
+        _tags.set({**_tags.get(), **tags})
+
+
+def traced(name, tags_fn=None):
+    """Decorate an async callback so it runs inside a span; `tags_fn()` (sync or async) supplies tags to bind first."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if not TRACE_ENABLED:
+                return await fn(*args, **kwargs)
+            if tags_fn is not None:
+                tags = tags_fn()
+                bind(**(await tags if inspect.isawaitable(tags) else tags))
+            with span(name):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def increment(metric, amount=1, **labels):
+    """Add to a labelled counter exported on /metrics; counters are kept even when tracing is off."""
+    key = (metric, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def register_collector(fn):
+    """Register a function returning extra Prometheus exposition lines for /metrics."""
+    _collectors.append(fn)
+
+
+def _export(span_, duration, status):
+    global _trace_file
+    record = {
+        "name": span_.name,
+        "span_id": span_.span_id,
+        "parent_id": span_.parent_id,
+        "start": span_.start,
+        "duration_ms": round(duration * 1000, 3),
+        "status": status,
+        **span_.tags,
+    }
+    line = json.dumps(record, default=str, separators=(",", ":"))
+    with _lock:
+        metrics = _span_metrics.get(span_.name)
+        if metrics is None:
+            metrics = _span_metrics[span_.name] = {
+                "count": 0,
+                "sum": 0.0,
+                "buckets": [0] * (len(DURATION_BUCKETS) + 1),
+                "tokens": dict.fromkeys(TOKEN_TAGS, 0),
+            }
+        metrics["count"] += 1
+        metrics["sum"] += duration
+        metrics["buckets"][bisect.bisect_left(DURATION_BUCKETS, duration)] += 1
+        for tag in TOKEN_TAGS:
+            metrics["tokens"][tag] += span_.tags.get(tag) or 0
+
+        if _trace_file is None:
+            _trace_file = open(TRACE_FILE, "a", buffering=1, encoding="utf-8")
+        _trace_file.write(line + "\n")
+
+
+def _labels(**labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+def render_metrics():
+    """Render span histograms, counters and registered collectors in Prometheus text format."""
+    lines = [
+        "# TYPE secret_agents_span_duration_seconds histogram",
+    ]
+    with _lock:
+        span_metrics = {name: {**m, "buckets": list(m["buckets"]), "tokens": dict(m["tokens"])} for name, m in _span_metrics.items()}
+        counters = dict(_counters)
+
+    for name, m in sorted(span_metrics.items()):
+        cumulative = 0
+        for bound, count in zip(DURATION_BUCKETS + ("+Inf",), m["buckets"]):
+            cumulative += count
+            lines.append(f"secret_agents_span_duration_seconds_bucket{_labels(span=name, le=bound)} {cumulative}")
+        lines.append(f"secret_agents_span_duration_seconds_sum{_labels(span=name)} {m['sum']}")
+        lines.append(f"secret_agents_span_duration_seconds_count{_labels(span=name)} {m['count']}")
+
+    lines.append("# TYPE secret_agents_span_tokens_total counter")
+    for name, m in sorted(span_metrics.items()):
+        for kind, value in m["tokens"].items():
+            if value:
+                lines.append(f"secret_agents_span_tokens_total{_labels(span=name, kind=kind)} {value}")
+
+    for (metric, labels), value in sorted(counters.items()):
+        lines.append(f"secret_agents_{metric}_total{_labels(**dict(labels))} {value}")
+
+    for collector in _collectors:
+        lines.extend(collector())
+    return "\n".join(lines) + "\n"